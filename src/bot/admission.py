@@ -0,0 +1,124 @@
+import time
+from enum import IntEnum
+from typing import Callable, Dict, List, Optional
+
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class DegradationLevel(IntEnum):
+    NORMAL = 0
+    NO_TTS = 1          # отвечаем текстом без синтеза речи
+    SMALL_STT = 2       # распознаём речь меньшей моделью Whisper
+    SHORT_HISTORY = 3   # урезаем историю в промпте
+    REJECT = 4          # просим повторить позже
+
+
+class AdmissionController:
+    """Контроль нагрузки с пошаговой деградацией.
+
+    Нагрузка — максимум из отношения очереди к max_in_flight (запросы в работе
+    плюс ещё не разобранные обновления из queue_depth, например
+    application.update_queue.qsize) и отношений сглаженных стоимостей этапов к их целевым значениям. Стоимость
+    нормирована на размер входа, чтобы одна длинная голосовая не выглядела
+    перегрузкой: stt — real-time factor (секунды распознавания на секунду
+    аудио), llm — секунды на сгенерированный токен, tts — секунды на 100 символов.
+    Среднее стартует с seed_ratio * target, а замер ограничен
+    max_sample_ratio * target, поэтому один медленный запрос уровень не меняет.
+    При превышении thresholds[i] уровень сразу поднимается до i + 1, а опускается
+    по одному шагу, когда нагрузка ниже порога текущего уровня * recover_ratio
+    и с последнего переключения прошло не меньше min_dwell секунд.
+    """
+
+    def __init__(
+        self,
+        max_in_flight: int = 8,
+        stage_targets: Optional[Dict[str, float]] = None,
+        thresholds: Optional[List[float]] = None,
+        recover_ratio: float = 0.7,
+        min_dwell: float = 15.0,
+        alpha: float = 0.1,
+        half_life: float = 30.0,
+        seed_ratio: float = 0.5,
+        max_sample_ratio: float = 4.0,
+        queue_depth: Optional[Callable[[], int]] = None,
+    ):
+        self.max_in_flight = max_in_flight
+        self.stage_targets = stage_targets or {"stt": 0.5, "llm": 0.25, "tts": 1.5}
+        self.thresholds = thresholds or [1.0, 1.5, 2.0, 3.0]
+        self.recover_ratio = recover_ratio
+        self.min_dwell = min_dwell
+        self.alpha = alpha
+        self.half_life = half_life
+        self.seed_ratio = seed_ratio
+        self.max_sample_ratio = max_sample_ratio
+        self.queue_depth = queue_depth
+        self.in_flight = 0
+        self.level = DegradationLevel.NORMAL
+        self._latency: Dict[str, float] = {}
+        self._latency_at: Dict[str, float] = {}
+        self._changed_at = 0.0
+
+    def try_enter(self) -> bool:
+        """Принимает запрос в работу; False — запрос нужно отклонить"""
+        self._reevaluate()
+        if self.level >= DegradationLevel.REJECT:
+            return False
+        self.in_flight += 1
+        self._reevaluate()
+        return True
+
+    def leave(self):
+        self.in_flight = max(0, self.in_flight - 1)
+        self._reevaluate()
+
+    def record(self, stage: str, cost: float):
+        """Учитывает нормированную стоимость этапа в экспоненциальном среднем"""
+        target = self.stage_targets.get(stage)
+        if target is None:
+            return
+        now = time.monotonic()
+        previous = self._decayed(stage, now)
+        if previous is None:
+            previous = target * self.seed_ratio
+        cost = min(cost, target * self.max_sample_ratio)
+        self._latency[stage] = previous + self.alpha * (cost - previous)
+        self._latency_at[stage] = now
+        self._reevaluate()
+
+    def _decayed(self, stage: str, now: float) -> Optional[float]:
+        # Без новых замеров (например, когда запросы отклоняются) оценка затухает
+        if stage not in self._latency:
+            return None
+        age = now - self._latency_at[stage]
+        return self._latency[stage] * 0.5 ** (age / self.half_life)
+
+    def load(self) -> float:
+        now = time.monotonic()
+        backlog = self.in_flight + (self.queue_depth() if self.queue_depth else 0)
+        score = backlog / self.max_in_flight
+        for stage, target in self.stage_targets.items():
+            latency = self._decayed(stage, now)
+            if latency is not None:
+                score = max(score, latency / target)
+        return score
+
+    def _reevaluate(self):
+        now = time.monotonic()
+        score = self.load()
+        target = DegradationLevel(sum(score >= t for t in self.thresholds))
+
+        if target > self.level:
+            self._set_level(target, score, now)
+        elif target < self.level and now - self._changed_at >= self.min_dwell:
+            if score < self.thresholds[self.level - 1] * self.recover_ratio:
+                self._set_level(DegradationLevel(self.level - 1), score, now)
+
+    def _set_level(self, level: DegradationLevel, score: float, now: float):
+        logger.warning(
+            f"📉 Уровень деградации {self.level.name} → {level.name} "
+            f"(нагрузка {score:.2f}, в работе {self.in_flight})"
+        )
+        self.level = level
+        self._changed_at = now
@@ -1,27 +1,92 @@
 from telegram import Update
 from telegram.ext import ContextTypes
+import asyncio
 import logging
-import ollama
+import time
 from pathlib import Path
+from typing import Optional
 
-from src.config.settings import MODEL_NAME, VOICE_ENABLED
-from src.config.constants import SYSTEM_PROMPT
+from src.config.settings import MODEL_NAME, STATUS_EDIT_INTERVAL
+from src.config.constants import (
+    SYSTEM_PROMPT, MAX_HISTORY_CHARS, HISTORY_MESSAGES_LIMIT, HISTORY_WINDOW_MAX,
+    HISTORY_SHORT_LIMIT
+)
 from src.database.repository import Database
+from src.llm.client import LLMClient
+from src.llm.prompt import build_messages, select_history_window
 from src.voice.tts_manager import EdgeTTSManager
 from src.voice.stt_processor import STTProcessor
 from src.voice.audio_utils import download_voice, convert_to_wav, safe_unlink
+from src.bot.admission import AdmissionController, DegradationLevel
+from src.bot.session import SessionStore, UserSession
+from src.bot.status import StatusMessage
 from src.utils.logger import get_logger
 
 logger = get_logger(__name__)
 
-# Глобальная переменная для управления голосом
-voice_enabled = VOICE_ENABLED
+OVERLOAD_REPLY = "⏳ Сейчас слишком много запросов. Попробуйте ещё раз через минуту."
 
 class BotHandlers:
-    def __init__(self, db: Database, tts: EdgeTTSManager, stt: STTProcessor):
+    def __init__(
+        self,
+        db: Database,
+        tts: EdgeTTSManager,
+        stt: STTProcessor,
+        llm: LLMClient,
+        sessions: SessionStore,
+        admission: Optional[AdmissionController] = None,
+    ):
         self.db = db
         self.tts = tts
         self.stt = stt
+        self.llm = llm
+        self.sessions = sessions
+        self.admission = admission or AdmissionController()
+    
+    def _log_latency(self, user_id: int, stage: str, started: float, message: str, *args) -> float:
+        """Логирует задержку этапа; возвращает её в секундах"""
+        elapsed = time.monotonic() - started
+        latency_ms = int(elapsed * 1000)
+        logger.info(
+            message, *args, latency_ms,
+            extra={"user_id": user_id, "stage": stage, "latency_ms": latency_ms}
+        )
+        return elapsed
+    
+    def _record_llm_cost(self, response: dict):
+        """Время на токен ответа; ответы из кэша нагрузку не отражают"""
+        tokens = response.get("eval_count")
+        duration = response.get("eval_duration")
+        if tokens and duration and not response.get("cached"):
+            self.admission.record("llm", duration / 1e9 / tokens)
+    
+    def _record_tts_cost(self, elapsed: float, text: str):
+        # Секунды на 100 символов; короткие ответы считаем за 100 символов
+        self.admission.record("tts", elapsed * 100 / max(len(text), 100))
+    
+    async def _save_and_build_prompt(
+        self, user_id: int, session: UserSession, user_text: str, short: bool = False
+    ) -> list:
+        """Сохраняет сообщение пользователя и строит промпт со стабильным префиксом.
+
+        Окно истории до предыдущего хода читается до записи нового сообщения,
+        поэтому запрос может уйти на реплику; само сообщение дописывается в конец
+        из памяти. При short=True (перегрузка) в промпт идут только последние
+        сообщения окна.
+        """
+        rows = await self.db.get_history_window(user_id, session.history_anchor, HISTORY_WINDOW_MAX)
+        message_id = await self.db.save_message(user_id, 'user', user_text)
+        rows.append({"id": message_id, "role": "user", "content": user_text})
+        history, session.history_anchor = select_history_window(
+            rows,
+            session.history_anchor,
+            max_messages=HISTORY_WINDOW_MAX,
+            max_chars=MAX_HISTORY_CHARS,
+            keep_messages=HISTORY_MESSAGES_LIMIT,
+        )
+        if short:
+            history = history[-HISTORY_SHORT_LIMIT:]
+        return build_messages(SYSTEM_PROMPT, history)
     
     async def start(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Обработчик /start"""
@@ -30,7 +95,8 @@ class BotHandlers:
             user.id, user.username, user.first_name, user.last_name
         )
         
-        voice_status = "включены 🎤" if voice_enabled else "отключены 🔇"
+        session = self.sessions.get(user.id)
+        voice_status = "включены 🎤" if session.voice_enabled else "отключены 🔇"
         
         await update.message.reply_text(
             f"🤖 Привет, {user.first_name}!\n"
@@ -50,14 +116,12 @@ class BotHandlers:
         
     async def voice_on(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Включить голосовые ответы"""
-        global voice_enabled
-        voice_enabled = True
+        self.sessions.get(update.effective_user.id).voice_enabled = True
         await update.message.reply_text("🔊 Голосовые ответы включены!")
     
     async def voice_off(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
         """Выключить голосовые ответы"""
-        global voice_enabled
-        voice_enabled = False
+        self.sessions.get(update.effective_user.id).voice_enabled = False
         await update.message.reply_text("🔇 Голосовые ответы отключены")
     
     async def test_edge_tts(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -123,7 +187,7 @@ class BotHandlers:
             return
         
         selected_voice = context.args[0]
-        self.tts.voice_preferences[user_id] = selected_voice
+        self.sessions.get(user_id).voice = selected_voice
         await update.message.reply_text(f"✅ Голос изменен на: {selected_voice}")
 
     async def reset(self, update: Update, context: ContextTypes.DEFAULT_TYPE):
@@ -133,12 +197,13 @@ class BotHandlers:
         try:
             # Используем метод класса Database
             await self.db.delete_user_history(user_id)
+            self.sessions.get(user_id).history_anchor = None
 
             await update.message.reply_text(
                 "🧹 История диалога очищена!\n"
                 "Можем начать общение заново."
             )
-            logger.info(f"🧹 Пользователь {user_id} очистил историю")
+            logger.info("🧹 Пользователь %s очистил историю", user_id, extra={"user_id": user_id})
 
         except Exception as e:
             logger.error(f"Ошибка при очистке истории: {e}")
@@ -173,7 +238,7 @@ class BotHandlers:
                 stats_text += f"   👤 {user_percent:.1f}% / 🤖 {bot_percent:.1f}%"
 
             await update.message.reply_text(stats_text, parse_mode='HTML')
-            logger.info(f"📊 Пользователь {user_id} запросил статистику")
+            logger.info("📊 Пользователь %s запросил статистику", user_id, extra={"user_id": user_id})
 
         except Exception as e:
             logger.error(f"Ошибка при получении статистики: {e}")
@@ -183,16 +248,25 @@ class BotHandlers:
         """Обработчик голосовых сообщений"""
         user = update.effective_user
         voice = update.message.voice
+        session = self.sessions.get(user.id)
         
-        logger.info(f"🎤 [{user.id}] Получено голосовое, длительность: {voice.duration}с")
+        logger.info(
+            "🎤 [%s] Получено голосовое, длительность: %sс", user.id, voice.duration,
+            extra={"user_id": user.id, "stage": "voice_received"}
+        )
+        
+        if not self.admission.try_enter():
+            await update.message.reply_text(OVERLOAD_REPLY)
+            return
         
-        # Показываем статус
-        await update.message.chat.send_action(action="typing")
-        await update.message.reply_text("🎧 Распознаю речь...")
+        # Одно статусное сообщение, которое правится по ходу обработки
+        status = StatusMessage(update.message, min_interval=STATUS_EDIT_INTERVAL)
+        status.start("🎧 Распознаю речь...")
         
         ogg_path = None
         wav_path = None
         audio_path = None
+        heard = None
         
         try:
             # 1. Скачиваем голосовое
@@ -201,38 +275,49 @@ class BotHandlers:
             # 2. Конвертируем в WAV
             wav_path = convert_to_wav(ogg_path)
             
-            # 3. Распознаём речь
-            user_text = self.stt.transcribe(wav_path)
-            logger.info(f"📝 Распознано: {user_text}")
+            # 3. Распознаём речь (в потоке, чтобы не блокировать остальных)
+            started = time.monotonic()
+            user_text = await asyncio.to_thread(
+                self.stt.transcribe, wav_path,
+                degraded=self.admission.level >= DegradationLevel.SMALL_STT,
+            )
+            elapsed = self._log_latency(user.id, "stt", started, "📝 Распознано: %s за %d мс", user_text)
+            # Real-time factor: время распознавания не зависит от длины голосового
+            self.admission.record("stt", elapsed / max(voice.duration or 0, 1))
             
             # 4. Показываем пользователю, что услышали
-            await update.message.reply_text(f"📝 Вы сказали: {user_text}")
+            heard = f"📝 Вы сказали: {user_text}"
+            status.update(f"{heard}\n\n🤔 Думаю над ответом...")
             
-            # 5. Сохраняем в БД
+            # 5. Сохраняем в БД и собираем промпт с историей
             await self.db.ensure_user(user.id, user.username, user.first_name, user.last_name)
-            await self.db.save_message(user.id, 'user', user_text)
-            await self.db.trim_history(user.id)
-            
-            # 6. Получаем историю и генерируем ответ
-            history = await self.db.get_history(user.id)
-            messages = [{"role": "system", "content": SYSTEM_PROMPT}]
-            messages.extend(history)
+            messages = await self._save_and_build_prompt(
+                user.id, session, user_text, short=self.admission.level >= DegradationLevel.SHORT_HISTORY
+            )
             
-            response = ollama.chat(model=MODEL_NAME, messages=messages)
+            # 6. Генерируем ответ
+            started = time.monotonic()
+            response = await self.llm.chat(messages, user_id=user.id)
             answer = response.get("message", {}).get("content", "")
+            model = response.get("model") or MODEL_NAME
+            self._log_latency(user.id, "llm", started, "🤖 [%s] Ответ %s за %d мс", user.id, model)
+            self._record_llm_cost(response)
             
             if not answer.strip():
-                await update.message.reply_text("⚠️ Модель вернула пустой ответ.")
+                heard = f"{heard}\n\n⚠️ Модель вернула пустой ответ."
                 return
             
             # 7. Сохраняем ответ
-            await self.db.save_message(user.id, "assistant", answer, MODEL_NAME)
-            await self.db.trim_history(user.id)
+            await self.db.save_message(user.id, "assistant", answer, model)
             
-            # 8. Отправляем ответ (с голосом или без)
-            if voice_enabled and answer.strip():
-                await update.message.reply_text("🔊 Генерирую голосовой ответ...")
-                audio_path = await self.tts.text_to_speech(answer, user.id)
+            # 8. Отправляем ответ (с голосом или без; под нагрузкой — только текст)
+            if session.voice_enabled and self.admission.level < DegradationLevel.NO_TTS:
+                status.update(f"{heard}\n\n🔊 Генерирую голосовой ответ...")
+                status.set_action("record_voice")
+                started = time.monotonic()
+                audio_path = await self.tts.text_to_speech(answer, user.id, voice=session.voice)
+                elapsed = self._log_latency(user.id, "tts", started, "🔊 [%s] Голос готов за %d мс", user.id)
+                self._record_tts_cost(elapsed, answer)
                 
                 if audio_path and audio_path.exists():
                     with open(audio_path, 'rb') as audio_file:
@@ -249,8 +334,11 @@ class BotHandlers:
         except Exception as e:
             error_msg = f"❌ Ошибка при обработке голоса: {e}"
             logger.error(error_msg)
-            await update.message.reply_text(error_msg)
+            heard = f"{heard}\n\n{error_msg}" if heard else error_msg
         finally:
+            self.admission.leave()
+            await status.finish(heard)
+            
             # Чистим временные файлы
             safe_unlink(ogg_path)
             safe_unlink(wav_path)
@@ -260,33 +348,46 @@ class BotHandlers:
         """Обработчик текстовых сообщений"""
         user = update.effective_user
         user_text = update.message.text
+        session = self.sessions.get(user.id)
         audio_path = None
         
-        await self.db.ensure_user(user.id, user.username, user.first_name, user.last_name)
-        await self.db.save_message(user.id, 'user', user_text)
-        await self.db.trim_history(user.id)
+        logger.info(
+            "📨 [%s] Текст: %.50s...", user.id, user_text,
+            extra={"user_id": user.id, "stage": "text_received"}
+        )
         
-        logger.info(f"📨 [{user.id}] Текст: {user_text[:50]}...")
+        if not self.admission.try_enter():
+            await update.message.reply_text(OVERLOAD_REPLY)
+            return
         
-        await update.message.chat.send_action(action="typing")
+        status = StatusMessage(update.message)
+        status.start()
         
         try:
-            history = await self.db.get_history(user.id)
-            messages = [{"role": "system", "content": SYSTEM_PROMPT}]
-            messages.extend(history)
+            await self.db.ensure_user(user.id, user.username, user.first_name, user.last_name)
+            messages = await self._save_and_build_prompt(
+                user.id, session, user_text, short=self.admission.level >= DegradationLevel.SHORT_HISTORY
+            )
             
-            response = ollama.chat(model=MODEL_NAME, messages=messages)
+            started = time.monotonic()
+            response = await self.llm.chat(messages, user_id=user.id)
             answer = response.get("message", {}).get("content", "")
+            model = response.get("model") or MODEL_NAME
+            self._log_latency(user.id, "llm", started, "🤖 [%s] Ответ %s за %d мс", user.id, model)
+            self._record_llm_cost(response)
             
             if not answer.strip():
                 await update.message.reply_text("⚠️ Модель вернула пустой ответ.")
                 return
             
-            await self.db.save_message(user.id, "assistant", answer, MODEL_NAME)
-            await self.db.trim_history(user.id)
+            await self.db.save_message(user.id, "assistant", answer, model)
             
-            if voice_enabled:
-                audio_path = await self.tts.text_to_speech(answer, user.id)
+            if session.voice_enabled and self.admission.level < DegradationLevel.NO_TTS:
+                status.set_action("record_voice")
+                started = time.monotonic()
+                audio_path = await self.tts.text_to_speech(answer, user.id, voice=session.voice)
+                elapsed = self._log_latency(user.id, "tts", started, "🔊 [%s] Голос готов за %d мс", user.id)
+                self._record_tts_cost(elapsed, answer)
                 if audio_path and audio_path.exists():
                     with open(audio_path, 'rb') as audio_file:
                         await update.message.reply_voice(voice=audio_file)
@@ -300,4 +401,6 @@ class BotHandlers:
             logger.error(error_msg)
             await update.message.reply_text(error_msg)
         finally:
+            self.admission.leave()
+            await status.finish()
             safe_unlink(audio_path)
\ No newline at end of file
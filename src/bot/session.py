@@ -0,0 +1,102 @@
+import sys
+import time
+from collections import OrderedDict
+from dataclasses import dataclass
+from typing import Dict, Optional
+
+from src.utils.helpers import format_size
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+@dataclass(slots=True)
+class UserSession:
+    """Компактное состояние пользователя в памяти бота"""
+    voice: Optional[str] = None
+    voice_enabled: bool = True
+    last_activity: float = 0.0
+    history_anchor: Optional[int] = None  # id первого сообщения окна истории
+
+
+class SessionStore:
+    """Ограниченное хранилище сессий с вытеснением по LRU и времени простоя.
+
+    Число сессий ограничено max_sessions и оценкой памяти max_bytes,
+    сессии без активности дольше idle_ttl секунд удаляются при обращениях.
+    """
+
+    # Накладные расходы OrderedDict на одну запись: слот хэш-таблицы и узел
+    # связного списка (замерено через tracemalloc на CPython 3.11)
+    ENTRY_OVERHEAD = 110
+
+    def __init__(
+        self,
+        max_sessions: int = 100_000,
+        idle_ttl: float = 24 * 3600,
+        max_bytes: Optional[int] = None,
+        default_voice_enabled: bool = True,
+        report_interval: float = 600.0,
+    ):
+        self.idle_ttl = idle_ttl
+        self.default_voice_enabled = default_voice_enabled
+        self.report_interval = report_interval
+        self.entry_size = sys.getsizeof(UserSession()) + sys.getsizeof(2 ** 40) + self.ENTRY_OVERHEAD
+        self.max_sessions = max_sessions
+        if max_bytes:
+            self.max_sessions = max(1, min(max_sessions, max_bytes // self.entry_size))
+        self.evicted = 0
+        self._sessions: "OrderedDict[int, UserSession]" = OrderedDict()
+        self._last_report = time.monotonic()
+
+    def get(self, user_id: int) -> UserSession:
+        """Сессия пользователя; создаётся при первом обращении"""
+        now = time.monotonic()
+        session = self._sessions.get(user_id)
+        if session is None:
+            session = UserSession(voice_enabled=self.default_voice_enabled)
+            self._sessions[user_id] = session
+        else:
+            self._sessions.move_to_end(user_id)
+        session.last_activity = now
+        self._evict(now)
+        return session
+
+    def peek(self, user_id: int) -> Optional[UserSession]:
+        """Сессия без создания и без обновления активности"""
+        return self._sessions.get(user_id)
+
+    def _evict(self, now: float):
+        while len(self._sessions) > self.max_sessions:
+            self._sessions.popitem(last=False)
+            self.evicted += 1
+        # Самые старые записи в начале, поэтому проверяем только голову
+        while self._sessions:
+            oldest = next(iter(self._sessions.values()))
+            if now - oldest.last_activity <= self.idle_ttl:
+                break
+            self._sessions.popitem(last=False)
+            self.evicted += 1
+
+        if now - self._last_report >= self.report_interval:
+            self._last_report = now
+            stats = self.stats()
+            logger.info(
+                f"👥 Сессии: {stats['sessions']}/{stats['max_sessions']}, "
+                f"~{format_size(stats['bytes'])}, вытеснено {stats['evicted']}"
+            )
+
+    def size_bytes(self) -> int:
+        """Оценка памяти, занятой хранилищем"""
+        return len(self._sessions) * self.entry_size
+
+    def stats(self) -> Dict[str, int]:
+        return {
+            "sessions": len(self._sessions),
+            "max_sessions": self.max_sessions,
+            "bytes": self.size_bytes(),
+            "evicted": self.evicted,
+        }
+
+    def __len__(self) -> int:
+        return len(self._sessions)
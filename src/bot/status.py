@@ -0,0 +1,108 @@
+import asyncio
+import time
+from typing import Optional
+
+from telegram import Message
+from telegram.error import BadRequest, RetryAfter
+
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class StatusMessage:
+    """Одно статусное сообщение, которое редактируется по ходу обработки.
+
+    Отправка и правки идут в фоне: update() не ждёт Telegram, частые
+    правки схлопываются до последнего текста и идут не чаще min_interval.
+    Пока статус активен, индикатор действия (typing и т.п.) обновляется в фоне.
+    """
+
+    ACTION_REFRESH = 4.5  # Telegram показывает действие около 5 секунд
+
+    def __init__(self, source: Message, min_interval: float = 1.0, action: str = "typing"):
+        self.source = source
+        self.min_interval = min_interval
+        self.action = action
+        self._message: Optional[Message] = None
+        self._text: Optional[str] = None
+        self._pending: Optional[str] = None
+        self._last_edit = 0.0
+        self._send_task: Optional[asyncio.Task] = None
+        self._flush_task: Optional[asyncio.Task] = None
+        self._action_task: Optional[asyncio.Task] = None
+
+    def start(self, text: Optional[str] = None):
+        """Запускает индикатор действия и (если задан текст) отправляет статус"""
+        self._action_task = asyncio.create_task(self._action_loop())
+        if text:
+            self._text = text
+            self._send_task = asyncio.create_task(self._send(text))
+
+    def set_action(self, action: str):
+        self.action = action
+
+    def update(self, text: str):
+        """Запоминает новый текст статуса; отправка произойдёт в фоне"""
+        self._pending = text
+        if self._flush_task is None or self._flush_task.done():
+            self._flush_task = asyncio.create_task(self._flush())
+
+    async def finish(self, text: Optional[str] = None):
+        """Останавливает индикатор и дожидается последней правки"""
+        if self._action_task is not None:
+            self._action_task.cancel()
+            await asyncio.gather(self._action_task, return_exceptions=True)
+            self._action_task = None
+        if text is not None:
+            self.update(text)
+        if self._flush_task is not None:
+            await asyncio.gather(self._flush_task, return_exceptions=True)
+
+    async def _send(self, text: str):
+        try:
+            self._message = await self.source.reply_text(text)
+            self._last_edit = time.monotonic()
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось отправить статус: {e}")
+
+    async def _flush(self):
+        if self._send_task is not None:
+            await self._send_task
+        while self._pending is not None:
+            delay = self._last_edit + self.min_interval - time.monotonic()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            text, self._pending = self._pending, None
+            if text == self._text:
+                continue
+            try:
+                if self._message is None:
+                    await self._send(text)
+                else:
+                    await self._message.edit_text(text)
+                    self._last_edit = time.monotonic()
+                self._text = text
+            except RetryAfter as e:
+                retry_after = e.retry_after
+                retry_after = retry_after.total_seconds() if hasattr(retry_after, "total_seconds") else retry_after
+                logger.warning(f"⏳ Telegram просит подождать {retry_after}с перед правкой статуса")
+                self._last_edit = time.monotonic() + retry_after - self.min_interval
+                if self._pending is None:
+                    self._pending = text
+            except BadRequest as e:
+                if "not modified" not in str(e).lower():
+                    logger.warning(f"⚠️ Не удалось обновить статус: {e}")
+            except Exception as e:
+                logger.warning(f"⚠️ Не удалось обновить статус: {e}")
+
+    async def _action_loop(self):
+        while True:
+            try:
+                await self.source.chat.send_action(action=self.action)
+            except Exception as e:
+                logger.debug(
+                    "Не удалось отправить действие %s: %s", self.action, e,
+                    extra={"stage": "status_action"}
+                )
+            await asyncio.sleep(self.ACTION_REFRESH)
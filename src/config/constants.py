@@ -5,8 +5,20 @@ SYSTEM_PROMPT = """Ты — полезный ассистент. Отвечай
 # Настройки истории
 MAX_HISTORY_CHARS = 12000
 HISTORY_MESSAGES_LIMIT = 8
+# Окно истории растёт до HISTORY_WINDOW_MAX сообщений и затем сжимается до
+# HISTORY_MESSAGES_LIMIT, чтобы префикс промпта не менялся между ходами
+HISTORY_WINDOW_MAX = 16
+# Сколько последних сообщений истории оставлять при перегрузке
+HISTORY_SHORT_LIMIT = 4
 
 # Настройки аудио
 AUDIO_SAMPLE_RATE = 16000
 AUDIO_CHANNELS = 1
-TEMP_FILE_PREFIX = "bot_voice_"
\ No newline at end of file
+TEMP_FILE_PREFIX = "bot_voice_"
+
+# Маршрутизация моделей: слова, после которых запрос уходит в сильную модель
+COMPLEX_REQUEST_KEYWORDS = [
+    "объясни", "почему", "как работает", "сравни", "проанализируй", "подробно",
+    "пошагово", "докажи", "рассчитай", "посчитай", "напиши", "код", "алгоритм",
+    "переведи", "составь", "придумай", "разница", "плюсы и минусы",
+]
@@ -3,13 +3,77 @@ from dotenv import load_dotenv
 
 load_dotenv()
 
+# Logging
+LOG_LEVEL = os.getenv("LOG_LEVEL", "INFO")
+LOG_FILE = os.getenv("LOG_FILE", "logs/bot.log")
+LOG_JSON = os.getenv("LOG_JSON", "False").lower() == "true"
+LOG_MAX_BYTES = int(os.getenv("LOG_MAX_BYTES", 10 * 1024 * 1024))
+LOG_BACKUP_COUNT = int(os.getenv("LOG_BACKUP_COUNT", 5))
+LOG_SAMPLE_RATES = os.getenv("LOG_SAMPLE_RATES", "")
+
 # Telegram
 BOT_TOKEN = os.getenv("BOT_TOKEN")
 if not BOT_TOKEN:
     raise ValueError("BOT_TOKEN not set in .env file")
+STATUS_EDIT_INTERVAL = float(os.getenv("STATUS_EDIT_INTERVAL", 1.0))
+# Сколько обновлений обрабатывать одновременно; должно быть заметно больше
+# ADMISSION_MAX_IN_FLIGHT, иначе контроль нагрузки не увидит очередь
+BOT_CONCURRENT_UPDATES = int(os.getenv("BOT_CONCURRENT_UPDATES", 32))
+
+# Per-user sessions in memory
+SESSION_MAX_USERS = int(os.getenv("SESSION_MAX_USERS", 100_000))
+SESSION_IDLE_TTL = float(os.getenv("SESSION_IDLE_TTL", 24 * 3600))
+SESSION_MAX_BYTES = int(os.getenv("SESSION_MAX_BYTES", 64 * 1024 * 1024))
+
+# Admission control: пороги нагрузки для уровней NO_TTS, SMALL_STT, SHORT_HISTORY, REJECT
+ADMISSION_MAX_IN_FLIGHT = int(os.getenv("ADMISSION_MAX_IN_FLIGHT", 8))
+ADMISSION_THRESHOLDS = [float(t) for t in os.getenv("ADMISSION_THRESHOLDS", "1.0,1.5,2.0,3.0").split(",")]
+ADMISSION_MIN_DWELL = float(os.getenv("ADMISSION_MIN_DWELL", 15))
+# Целевые стоимости этапов, нормированные на размер входа
+STT_RTF_TARGET = float(os.getenv("STT_RTF_TARGET", 0.5))  # секунд распознавания на секунду аудио
+LLM_TOKEN_TIME_TARGET = float(os.getenv("LLM_TOKEN_TIME_TARGET", 0.25))  # секунд на токен ответа
+TTS_CHARS_TIME_TARGET = float(os.getenv("TTS_CHARS_TIME_TARGET", 1.5))  # секунд на 100 символов
 
 # LLM
 MODEL_NAME = os.getenv("MODEL_NAME", "llama3.1:8b")
+# Model routing: без FAST_MODEL_NAME все запросы идут в MODEL_NAME
+FAST_MODEL_NAME = os.getenv("FAST_MODEL_NAME")
+FAST_MODEL_BUDGET = float(os.getenv("FAST_MODEL_BUDGET", 10))
+STRONG_MODEL_BUDGET = float(os.getenv("STRONG_MODEL_BUDGET", 120))
+ROUTER_MAX_FAST_CHARS = int(os.getenv("ROUTER_MAX_FAST_CHARS", 160))
+ROUTER_MAX_FAST_HISTORY = int(os.getenv("ROUTER_MAX_FAST_HISTORY", 12))
+OLLAMA_HOSTS = [
+    h.strip() for h in os.getenv("OLLAMA_HOSTS", os.getenv("OLLAMA_HOST", "http://localhost:11434")).split(",")
+    if h.strip()
+]
+OLLAMA_TIMEOUT = float(os.getenv("OLLAMA_TIMEOUT", 300))
+OLLAMA_HEALTH_INTERVAL = float(os.getenv("OLLAMA_HEALTH_INTERVAL", 15))
+LLM_TEMPERATURE = float(os.getenv("LLM_TEMPERATURE")) if os.getenv("LLM_TEMPERATURE") else None
+
+# Ollama runtime: держим модель в памяти и передаём опции, влияющие на скорость
+_keep_alive = os.getenv("OLLAMA_KEEP_ALIVE", "30m")
+OLLAMA_KEEP_ALIVE = int(_keep_alive) if _keep_alive.lstrip("-").isdigit() else _keep_alive
+OLLAMA_KEEPALIVE_INTERVAL = float(os.getenv("OLLAMA_KEEPALIVE_INTERVAL", 240))
+LLM_OPTIONS = {
+    key: int(os.getenv(env))
+    for key, env in (
+        ("num_ctx", "OLLAMA_NUM_CTX"),
+        ("num_thread", "OLLAMA_NUM_THREAD"),
+        ("num_batch", "OLLAMA_NUM_BATCH"),
+        ("num_predict", "OLLAMA_NUM_PREDICT"),
+    )
+    if os.getenv(env)
+}
+if LLM_TEMPERATURE is not None:
+    LLM_OPTIONS["temperature"] = LLM_TEMPERATURE
+
+# LLM response cache
+LLM_CACHE_ENABLED = os.getenv("LLM_CACHE_ENABLED", "True").lower() == "true"
+LLM_CACHE_TTL = int(os.getenv("LLM_CACHE_TTL", 3600))
+LLM_CACHE_MAX_ENTRIES = int(os.getenv("LLM_CACHE_MAX_ENTRIES", 1000))
+LLM_CACHE_MAX_BYTES = int(os.getenv("LLM_CACHE_MAX_BYTES", 8 * 1024 * 1024))
+LLM_CACHE_PERSIST = os.getenv("LLM_CACHE_PERSIST", "False").lower() == "true"
+LLM_CACHE_SAMPLED = os.getenv("LLM_CACHE_SAMPLED", "False").lower() == "true"
 
 # Database
 POSTGRES_CONFIG = {
@@ -19,8 +83,37 @@ POSTGRES_CONFIG = {
     'user': os.getenv("POSTGRES_USER", "ai_bot_user"),
     'password': os.getenv("POSTGRES_PASSWD")
 }
+POSTGRES_POOL_MIN = int(os.getenv("POSTGRES_POOL_MIN", 10))
+POSTGRES_POOL_MAX = int(os.getenv("POSTGRES_POOL_MAX", 10))
+# Read replicas: "host[:port],host[:port]"; без них все запросы идут на primary
+POSTGRES_REPLICA_HOSTS = [h.strip() for h in os.getenv("POSTGRES_REPLICA_HOSTS", "").split(",") if h.strip()]
+POSTGRES_READ_POOL_MIN = int(os.getenv("POSTGRES_READ_POOL_MIN", 2))
+POSTGRES_READ_POOL_MAX = int(os.getenv("POSTGRES_READ_POOL_MAX", 10))
+POSTGRES_READ_TIMEOUT = float(os.getenv("POSTGRES_READ_TIMEOUT", 2))  # после него чтение уходит на primary
+# Сколько секунд после записи читать данные пользователя с primary
+READ_YOUR_WRITES_TTL = float(os.getenv("READ_YOUR_WRITES_TTL", 5))
+
+# History retention (фоновая очистка вместо DELETE на каждом сообщении)
+RETENTION_INTERVAL = float(os.getenv("RETENTION_INTERVAL", 300))
+RETENTION_KEEP_LAST = int(os.getenv("RETENTION_KEEP_LAST", 20))
+RETENTION_BATCH_SIZE = int(os.getenv("RETENTION_BATCH_SIZE", 5000))
+MESSAGES_RETENTION_DAYS = int(os.getenv("MESSAGES_RETENTION_DAYS", 0))  # 0 — не удалять секции
 
 # Voice settings
 VOICE_ENABLED = os.getenv("VOICE_ENABLED", "True").lower() == "true"
 WHISPER_MODEL = os.getenv("WHISPER_MODEL", "base")
-MAX_HISTORY = int(os.getenv("MAX_HISTORY", 10))
\ No newline at end of file
+WHISPER_DEGRADED_MODEL = os.getenv("WHISPER_DEGRADED_MODEL", "tiny")  # под нагрузкой
+# Профиль параметров Whisper (python -m src.voice.stt_tuner); с WHISPER_AUTOTUNE
+# подбирается при старте, если для этой модели и машины его ещё нет
+WHISPER_PROFILE_PATH = os.getenv("WHISPER_PROFILE_PATH", "temp/whisper_profile.json")
+WHISPER_SAMPLE_PATH = os.getenv("WHISPER_SAMPLE_PATH", "temp/whisper_sample.mp3")
+WHISPER_AUTOTUNE = os.getenv("WHISPER_AUTOTUNE", "False").lower() == "true"
+WHISPER_WER_TOLERANCE = float(os.getenv("WHISPER_WER_TOLERANCE", 0.05))
+MAX_HISTORY = int(os.getenv("MAX_HISTORY", 10))
+VOICE_CATALOG_PATH = os.getenv("VOICE_CATALOG_PATH", "temp/edge_tts_voices.json")
+VOICE_CATALOG_TTL = int(os.getenv("VOICE_CATALOG_TTL", 24 * 3600))
+TTS_HEDGE_DELAY = float(os.getenv("TTS_HEDGE_DELAY", 2.0))
+TTS_ATTEMPT_TIMEOUT = float(os.getenv("TTS_ATTEMPT_TIMEOUT", 20.0))
+TTS_CHUNK_CHARS = int(os.getenv("TTS_CHUNK_CHARS", 400))
+TTS_CHUNK_CONCURRENCY = int(os.getenv("TTS_CHUNK_CONCURRENCY", 4))
+TTS_CHUNK_CACHE_DIR = os.getenv("TTS_CHUNK_CACHE_DIR") or None
\ No newline at end of file
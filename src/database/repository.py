@@ -1,14 +1,122 @@
+import asyncio
 import asyncpg
-from typing import List, Dict, Any
+import json
+import logging
+import re
+import time
+from collections import OrderedDict
+from datetime import datetime, timedelta
+from typing import Awaitable, Callable, List, Dict, Any, Optional
 from .models import User, Message
 from src.config.settings import POSTGRES_CONFIG
-from src.config.constants import MAX_HISTORY_CHARS, HISTORY_MESSAGES_LIMIT
+
+logger = logging.getLogger(__name__)
+
+PARTITION_NAME_RE = re.compile(r"^messages_y(\d{4})m(\d{2})$")
+
+def _month_start(dt: datetime, offset: int = 0) -> datetime:
+    """Начало месяца со сдвигом на offset месяцев"""
+    month = dt.year * 12 + dt.month - 1 + offset
+    return datetime(month // 12, month % 12 + 1, 1)
+
+def _replica_config(config: Dict[str, Any], host: str) -> Dict[str, Any]:
+    """Параметры подключения к реплике: как у primary, но свой host[:port]"""
+    name, _, port = host.rpartition(":")
+    if name and port.isdigit():
+        return {**config, "host": name, "port": int(port)}
+    return {**config, "host": host}
 
 class Database:
+    """Доступ к PostgreSQL с отдельными пулами для записи и чтения.
+    
+    Запись и служебные запросы идут на primary. Чтение истории и статистики
+    распределяется по репликам, кроме пользователей, писавших за последние
+    pin_ttl секунд (чтобы они видели свой последний ход); при ошибке реплики
+    или если она не ответила за read_timeout секунд запрос повторяется на primary.
+    """
+    partitioned = False
+    
+    def __init__(
+        self,
+        config: Optional[Dict[str, Any]] = None,
+        replica_hosts: Optional[List[str]] = None,
+        pool_min: int = 10,
+        pool_max: int = 10,
+        read_pool_min: int = 2,
+        read_pool_max: int = 10,
+        pin_ttl: float = 5.0,
+        max_pins: int = 100_000,
+        read_timeout: float = 2.0,
+    ):
+        self.config = config or POSTGRES_CONFIG
+        self.replica_hosts = replica_hosts or []
+        self.pool_min = pool_min
+        self.pool_max = pool_max
+        self.read_pool_min = read_pool_min
+        self.read_pool_max = read_pool_max
+        self.pin_ttl = pin_ttl
+        self.max_pins = max_pins
+        self.read_timeout = read_timeout
+        self.pool = None
+        self.read_pools: List[asyncpg.Pool] = []
+        self._read_index = 0
+        self._pinned: "OrderedDict[int, float]" = OrderedDict()
+    
     async def init(self):
-        self.pool = await asyncpg.create_pool(**POSTGRES_CONFIG)
+        self.pool = await asyncpg.create_pool(
+            **self.config, min_size=self.pool_min, max_size=self.pool_max
+        )
+        for host in self.replica_hosts:
+            try:
+                pool = await asyncpg.create_pool(
+                    **_replica_config(self.config, host),
+                    min_size=self.read_pool_min, max_size=self.read_pool_max,
+                )
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError) as e:
+                logger.warning(f"⚠️ Реплика {host} недоступна, чтение пойдёт на primary: {e!r}")
+                continue
+            self.read_pools.append(pool)
         await self._create_tables()
     
+    def _pin(self, user_id: int):
+        """Закрепить чтение пользователя за primary на pin_ttl секунд"""
+        if not self.read_pools:
+            return
+        now = time.monotonic()
+        self._pinned[user_id] = now + self.pin_ttl
+        self._pinned.move_to_end(user_id)
+        while len(self._pinned) > self.max_pins:
+            self._pinned.popitem(last=False)
+        # TTL у всех одинаковый, поэтому истёкшие записи всегда в начале
+        while self._pinned and next(iter(self._pinned.values())) <= now:
+            self._pinned.popitem(last=False)
+    
+    def _read_pool(self, user_id: int) -> Optional[asyncpg.Pool]:
+        if not self.read_pools:
+            return None
+        expires = self._pinned.get(user_id)
+        if expires is not None:
+            if expires > time.monotonic():
+                return None
+            del self._pinned[user_id]
+        self._read_index = (self._read_index + 1) % len(self.read_pools)
+        return self.read_pools[self._read_index]
+    
+    async def _read(self, user_id: int, query: Callable[[asyncpg.Connection], Awaitable[Any]]) -> Any:
+        """Выполнить запрос на чтение на реплике, при ошибке или таймауте — на primary"""
+        pool = self._read_pool(user_id)
+        if pool is not None:
+            try:
+                return await asyncio.wait_for(self._run_read(pool, query), self.read_timeout)
+            except (OSError, asyncio.TimeoutError, asyncpg.PostgresError, asyncpg.InterfaceError) as e:
+                logger.warning(f"⚠️ Ошибка чтения с реплики, повтор на primary: {e!r}")
+        return await self._run_read(self.pool, query)
+    
+    @staticmethod
+    async def _run_read(pool: asyncpg.Pool, query: Callable[[asyncpg.Connection], Awaitable[Any]]) -> Any:
+        async with pool.acquire() as conn:
+            return await query(conn)
+    
     async def _create_tables(self):
         async with self.pool.acquire() as conn:
             await conn.execute('''
@@ -20,16 +128,121 @@ class Database:
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             ''')
+            # Новые установки получают таблицу, секционированную по месяцам;
+            # уже существующая обычная таблица продолжает работать как есть
+            relkind = await conn.fetchval("SELECT relkind::text FROM pg_class WHERE oid = to_regclass('messages')")
+            if relkind is None:
+                await conn.execute('''
+                    CREATE TABLE messages (
+                        id BIGSERIAL,
+                        user_id BIGINT REFERENCES users(user_id) ON DELETE CASCADE,
+                        role TEXT NOT NULL,
+                        content TEXT NOT NULL,
+                        model TEXT,
+                        created_at TIMESTAMP NOT NULL DEFAULT CURRENT_TIMESTAMP,
+                        PRIMARY KEY (id, created_at)
+                    ) PARTITION BY RANGE (created_at)
+                ''')
+                relkind = 'p'
+            self.partitioned = relkind == 'p'
+            if self.partitioned:
+                await conn.execute(
+                    "CREATE TABLE IF NOT EXISTS messages_default PARTITION OF messages DEFAULT"
+                )
+            await conn.execute('''
+                CREATE INDEX IF NOT EXISTS idx_messages_user_created
+                ON messages (user_id, created_at DESC)
+            ''')
             await conn.execute('''
-                CREATE TABLE IF NOT EXISTS messages (
-                    id BIGSERIAL PRIMARY KEY,
-                    user_id BIGINT REFERENCES users(user_id) ON DELETE CASCADE,
-                    role TEXT NOT NULL,
-                    content TEXT NOT NULL,
+                CREATE TABLE IF NOT EXISTS llm_cache (
+                    key TEXT PRIMARY KEY,
                     model TEXT,
+                    response TEXT NOT NULL,
                     created_at TIMESTAMP DEFAULT CURRENT_TIMESTAMP
                 )
             ''')
+        await self.ensure_partitions()
+    
+    async def ensure_partitions(self, months_ahead: int = 2):
+        """Создать месячные секции messages на текущий и следующие месяцы"""
+        if not self.partitioned:
+            return
+        async with self.pool.acquire() as conn:
+            now = await conn.fetchval("SELECT LOCALTIMESTAMP")
+            for offset in range(months_ahead + 1):
+                start = _month_start(now, offset)
+                end = _month_start(now, offset + 1)
+                await conn.execute(f'''
+                    CREATE TABLE IF NOT EXISTS messages_y{start.year}m{start.month:02d}
+                    PARTITION OF messages
+                    FOR VALUES FROM ('{start.isoformat()}') TO ('{end.isoformat()}')
+                ''')
+    
+    async def drop_expired_partitions(self, retention_days: int) -> List[str]:
+        """Удалить месячные секции, целиком старше retention_days"""
+        if not self.partitioned or retention_days <= 0:
+            return []
+        dropped = []
+        async with self.pool.acquire() as conn:
+            cutoff = await conn.fetchval("SELECT LOCALTIMESTAMP") - timedelta(days=retention_days)
+            names = await conn.fetch('''
+                SELECT c.relname
+                FROM pg_inherits i
+                JOIN pg_class c ON c.oid = i.inhrelid
+                WHERE i.inhparent = 'messages'::regclass
+            ''')
+            for row in names:
+                match = PARTITION_NAME_RE.match(row["relname"])
+                if not match:
+                    continue
+                end = _month_start(datetime(int(match[1]), int(match[2]), 1), 1)
+                if end <= cutoff:
+                    await conn.execute(f"ALTER TABLE messages DETACH PARTITION {row['relname']}")
+                    await conn.execute(f"DROP TABLE {row['relname']}")
+                    dropped.append(row["relname"])
+        return dropped
+    
+    async def trim_histories(self, keep_last: int, active_within: Optional[float] = None, batch_size: int = 5000) -> int:
+        """Оставить каждому пользователю keep_last последних сообщений.
+        
+        Удаляет пачками по batch_size; если задан active_within — только у пользователей,
+        писавших за последние active_within секунд. Возвращает число удалённых строк.
+        """
+        deleted = 0
+        async with self.pool.acquire() as conn:
+            while True:
+                result = await conn.execute('''
+                    DELETE FROM messages m
+                    USING (
+                        SELECT id, created_at FROM (
+                            SELECT id, created_at,
+                                ROW_NUMBER() OVER (
+                                    PARTITION BY user_id ORDER BY created_at DESC, id DESC
+                                ) AS rn
+                            FROM messages
+                            WHERE $3::float8 IS NULL OR user_id IN (
+                                SELECT DISTINCT user_id FROM messages
+                                WHERE created_at > LOCALTIMESTAMP - make_interval(secs => $3)
+                            )
+                        ) ranked
+                        WHERE rn > $1
+                        LIMIT $2
+                    ) old
+                    WHERE m.id = old.id AND m.created_at = old.created_at
+                ''', keep_last, batch_size, active_within)
+                count = int(result.split()[-1])
+                deleted += count
+                if count < batch_size:
+                    return deleted
+    
+    async def purge_llm_cache(self, ttl: int) -> int:
+        """Удалить просроченные записи кэша LLM"""
+        async with self.pool.acquire() as conn:
+            result = await conn.execute('''
+                DELETE FROM llm_cache
+                WHERE created_at <= CURRENT_TIMESTAMP - make_interval(secs => $1)
+            ''', float(ttl))
+            return int(result.split()[-1])
     
     async def ensure_user(self, user_id: int, username: str, first_name: str, last_name: str):
         async with self.pool.acquire() as conn:
@@ -42,64 +255,65 @@ class Database:
                     last_name = EXCLUDED.last_name
             ''', user_id, username, first_name, last_name)
     
-    async def save_message(self, user_id: int, role: str, content: str, model: str = None):
+    async def save_message(self, user_id: int, role: str, content: str, model: str = None) -> int:
+        """Сохранить сообщение; возвращает его id"""
         async with self.pool.acquire() as conn:
-            await conn.execute('''
+            message_id = await conn.fetchval('''
                 INSERT INTO messages (user_id, role, content, model)
                 VALUES ($1, $2, $3, $4)
+                RETURNING id
             ''', user_id, role, content, model)
+        self._pin(user_id)
+        return message_id
     
-    async def get_history(self, user_id: int) -> List[Dict[str, str]]:
-        async with self.pool.acquire() as conn:
-            rows = await conn.fetch('''
-                SELECT role, content
+    async def get_history_window(self, user_id: int, anchor_id: Optional[int], limit: int) -> List[Dict[str, Any]]:
+        """Последние limit сообщений начиная с anchor_id (по возрастанию id)"""
+        async def query(conn):
+            return await conn.fetch('''
+                SELECT id, role, content
                 FROM messages
                 WHERE user_id = $1
-                    AND content IS NOT NULL
-                    AND LENGTH(TRIM(content)) > 0
-                ORDER BY created_at DESC
-                LIMIT $2
-            ''', user_id, HISTORY_MESSAGES_LIMIT)
-            
-            rows = list(reversed(rows))
-            history = []
-            total_chars = 0
-            
-            for r in rows:
-                content = r["content"].strip()
-                if not content:
-                    continue
-                    
-                total_chars += len(content)
-                if total_chars > MAX_HISTORY_CHARS:
-                    break
-                    
-                history.append({
-                    "role": r["role"],
-                    "content": content
-                })
-            
-            return history
+                    AND ($2::bigint IS NULL OR id >= $2)
+                ORDER BY id DESC
+                LIMIT $3
+            ''', user_id, anchor_id, limit)
+        
+        rows = await self._read(user_id, query)
+        return [dict(r) for r in reversed(rows)]
     
-    async def trim_history(self, user_id: int, keep_last: int = 20):
+    async def get_llm_cache(self, key: str, ttl: int) -> Optional[Dict[str, Any]]:
+        """Получить закэшированный ответ LLM, если он не старше ttl секунд"""
+        async with self.pool.acquire() as conn:
+            response = await conn.fetchval('''
+                SELECT response FROM llm_cache
+                WHERE key = $1
+                    AND created_at > CURRENT_TIMESTAMP - make_interval(secs => $2)
+            ''', key, float(ttl))
+            return json.loads(response) if response else None
+
+    async def save_llm_cache(self, key: str, model: str, response: Dict[str, Any]):
+        """Сохранить ответ LLM в кэш"""
         async with self.pool.acquire() as conn:
             await conn.execute('''
-                DELETE FROM messages
-                WHERE id IN (
-                    SELECT id FROM messages
-                    WHERE user_id = $1
-                    ORDER BY created_at DESC
-                    OFFSET $2
-                )
-            ''', user_id, keep_last)
+                INSERT INTO llm_cache (key, model, response)
+                VALUES ($1, $2, $3)
+                ON CONFLICT (key) DO UPDATE SET
+                    response = EXCLUDED.response,
+                    created_at = CURRENT_TIMESTAMP
+            ''', key, model, json.dumps(response, ensure_ascii=False))
 
     async def close(self):
         """Безопасное закрытие соединения с БД"""
+        for pool in self.read_pools:
+            try:
+                await pool.close()
+            except Exception as e:
+                logger.error(f"Ошибка при закрытии пула реплики: {e}")
+        self.read_pools = []
         if hasattr(self, 'pool') and self.pool:
             try:
                 await self.pool.close()
             except Exception as e:
-                logger = logging.getLogger(__name__)
                 logger.error(f"Ошибка при закрытии пула соединений: {e}")
             finally:
                 self.pool = None
@@ -111,10 +325,11 @@ class Database:
                 DELETE FROM messages
                 WHERE user_id = $1
             ''', user_id)
+        self._pin(user_id)
     
     async def get_user_stats(self, user_id: int) -> dict:
         """Получить статистику пользователя"""
-        async with self.pool.acquire() as conn:
+        async def query(conn):
             # Общее количество сообщений
             total = await conn.fetchval('''
                 SELECT COUNT(*) FROM messages WHERE user_id = $1
@@ -154,4 +369,6 @@ class Database:
                 'bot_msgs': bot_msgs or 0,
                 'first_msg': first_msg,
                 'last_msg': last_msg
-            }
\ No newline at end of file
+            }
+        
+        return await self._read(user_id, query)
\ No newline at end of file
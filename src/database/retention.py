@@ -0,0 +1,75 @@
+import asyncio
+import time
+from typing import Optional
+
+from src.database.repository import Database
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class RetentionWorker:
+    """Фоновая очистка истории вместо DELETE на каждом сообщении.
+
+    Раз в interval секунд создаёт секции messages на будущие месяцы,
+    обрезает историю активных пользователей до keep_last сообщений,
+    удаляет секции старше retention_days и просроченный кэш LLM.
+    """
+
+    def __init__(
+        self,
+        db: Database,
+        interval: float = 300.0,
+        keep_last: int = 20,
+        batch_size: int = 5000,
+        retention_days: int = 0,
+        llm_cache_ttl: Optional[int] = None,
+    ):
+        self.db = db
+        self.interval = interval
+        self.keep_last = keep_last
+        self.batch_size = batch_size
+        self.retention_days = retention_days
+        self.llm_cache_ttl = llm_cache_ttl
+        self._last_run: Optional[float] = None
+        self._task: Optional[asyncio.Task] = None
+
+    async def run_once(self):
+        started = time.monotonic()
+        await self.db.ensure_partitions()
+
+        # Первый проход — по всем пользователям, дальше только по писавшим с прошлого раза
+        active_within = None
+        if self._last_run is not None:
+            active_within = started - self._last_run + self.interval
+        deleted = await self.db.trim_histories(self.keep_last, active_within, self.batch_size)
+
+        dropped = await self.db.drop_expired_partitions(self.retention_days)
+        purged = 0
+        if self.llm_cache_ttl:
+            purged = await self.db.purge_llm_cache(self.llm_cache_ttl)
+
+        self._last_run = started
+        logger.info(
+            "🧹 Очистка истории: удалено %d сообщений, секций %d, записей кэша %d за %.1fс",
+            deleted, len(dropped), purged, time.monotonic() - started,
+            extra={"stage": "retention"}
+        )
+
+    async def _loop(self):
+        while True:
+            try:
+                await self.run_once()
+            except Exception as e:
+                logger.error(f"Ошибка фоновой очистки истории: {e}")
+            await asyncio.sleep(self.interval)
+
+    def start(self):
+        if self._task is None:
+            self._task = asyncio.create_task(self._loop())
+
+    async def stop(self):
+        if self._task is not None:
+            self._task.cancel()
+            await asyncio.gather(self._task, return_exceptions=True)
+            self._task = None
@@ -0,0 +1,110 @@
+import hashlib
+import json
+import time
+from collections import OrderedDict
+from typing import Any, Dict, List, Optional, Tuple
+
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class ResponseCache:
+    """Кэш ответов LLM с точным совпадением запроса.
+
+    Ключ — хэш (модель, опции, нормализованный список сообщений).
+    Первый уровень — LRU в памяти с ограничением по числу записей и байтам,
+    второй (опционально) — таблица llm_cache в Postgres.
+    """
+
+    def __init__(
+        self,
+        ttl: int = 3600,
+        max_entries: int = 1000,
+        max_bytes: int = 8 * 1024 * 1024,
+        db=None,
+        cache_sampled: bool = False,
+    ):
+        self.ttl = ttl
+        self.max_entries = max_entries
+        self.max_bytes = max_bytes
+        self.db = db
+        self.cache_sampled = cache_sampled
+        self._entries: "OrderedDict[str, Tuple[float, Dict[str, Any], int]]" = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+
+    @staticmethod
+    def make_key(model: str, messages: List[Dict[str, str]], options: Optional[Dict[str, Any]] = None) -> str:
+        """Строит ключ кэша из модели, опций и нормализованных сообщений"""
+        normalized = [
+            {"role": m.get("role", ""), "content": " ".join((m.get("content") or "").split())}
+            for m in messages
+        ]
+        payload = json.dumps(
+            {"model": model, "options": options or {}, "messages": normalized},
+            ensure_ascii=False,
+            sort_keys=True,
+        )
+        return hashlib.sha256(payload.encode()).hexdigest()
+
+    def is_cacheable(self, options: Optional[Dict[str, Any]] = None) -> bool:
+        """Кэшируются только ответы с явным temperature <= 0, если сэмплирование не разрешено явно.
+
+        Без temperature Ollama сэмплирует с температурой модели (0.8 по умолчанию).
+        """
+        if self.cache_sampled:
+            return True
+        temperature = (options or {}).get("temperature")
+        return temperature is not None and temperature <= 0
+
+    async def get(self, key: str) -> Optional[Dict[str, Any]]:
+        entry = self._entries.get(key)
+        if entry is not None:
+            created_at, response, _ = entry
+            if time.monotonic() - created_at <= self.ttl:
+                self._entries.move_to_end(key)
+                self.hits += 1
+                return response
+            self._evict(key)
+
+        if self.db is not None:
+            try:
+                response = await self.db.get_llm_cache(key, self.ttl)
+            except Exception as e:
+                logger.warning(f"⚠️ Ошибка чтения кэша LLM из БД: {e}")
+                response = None
+            if response is not None:
+                self._store(key, response)
+                self.hits += 1
+                return response
+
+        self.misses += 1
+        return None
+
+    async def set(self, key: str, response: Dict[str, Any]):
+        self._store(key, response)
+        if self.db is not None:
+            try:
+                await self.db.save_llm_cache(key, response.get("model"), response)
+            except Exception as e:
+                logger.warning(f"⚠️ Ошибка записи кэша LLM в БД: {e}")
+
+    def _store(self, key: str, response: Dict[str, Any]):
+        size = len(json.dumps(response, ensure_ascii=False).encode())
+        if size > self.max_bytes:
+            return
+        if key in self._entries:
+            self._evict(key)
+        self._entries[key] = (time.monotonic(), response, size)
+        self._bytes += size
+        while len(self._entries) > self.max_entries or self._bytes > self.max_bytes:
+            self._evict(next(iter(self._entries)))
+
+    def _evict(self, key: str):
+        _, _, size = self._entries.pop(key)
+        self._bytes -= size
+
+    def __len__(self) -> int:
+        return len(self._entries)
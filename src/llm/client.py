@@ -0,0 +1,167 @@
+import asyncio
+import time
+from typing import Any, Dict, List, Optional
+
+from src.config.settings import MODEL_NAME
+from src.llm.cache import ResponseCache
+from src.llm.gateway import LLMGateway
+from src.llm.router import ModelRouter
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class LLMClient:
+    """Асинхронный клиент Ollama с кэшем ответов и выбором модели.
+
+    Держит модели загруженными: warm_up() при старте и периодические
+    пинги с тем же keep_alive и опциями, что и у обычных запросов
+    (другой num_ctx заставил бы Ollama перезагрузить модель).
+    """
+
+    def __init__(
+        self,
+        gateway: LLMGateway,
+        model: str = MODEL_NAME,
+        cache: Optional[ResponseCache] = None,
+        options: Optional[Dict[str, Any]] = None,
+        router: Optional[ModelRouter] = None,
+        keep_alive: Any = None,
+        keepalive_interval: float = 0,
+    ):
+        self.model = model
+        self.cache = cache
+        self.router = router
+        self.options = options or {}
+        self.gateway = gateway
+        self.keep_alive = keep_alive
+        self.keepalive_interval = keepalive_interval
+        self._keepalive_task: Optional[asyncio.Task] = None
+
+    @property
+    def models(self) -> List[str]:
+        models = [self.model]
+        if self.router is not None:
+            models = list(dict.fromkeys([self.router.fast.model, self.router.strong.model, self.model]))
+        return models
+
+    async def warm_up(self):
+        """Загружает и закрепляет модели на серверах Ollama"""
+        for model in self.models:
+            started = time.monotonic()
+            loaded = await self.gateway.preload(model, self.keep_alive, self.options or None)
+            logger.info(
+                f"🔥 Модель {model} загружена на {loaded}/{len(self.gateway.endpoints)} серверах "
+                f"за {time.monotonic() - started:.1f}с"
+            )
+
+    async def _keepalive_loop(self):
+        while True:
+            await asyncio.sleep(self.keepalive_interval)
+            try:
+                for model in self.models:
+                    await self.gateway.preload(model, self.keep_alive, self.options or None)
+            except Exception as e:
+                logger.error(f"Ошибка keep-alive Ollama: {e}")
+
+    def start_keepalive(self):
+        if self.keepalive_interval > 0 and self._keepalive_task is None:
+            self._keepalive_task = asyncio.create_task(self._keepalive_loop())
+
+    async def close(self):
+        if self._keepalive_task is not None:
+            self._keepalive_task.cancel()
+            await asyncio.gather(self._keepalive_task, return_exceptions=True)
+            self._keepalive_task = None
+
+    async def chat(
+        self,
+        messages: List[Dict[str, str]],
+        user_id: Optional[int] = None,
+        model: str = None,
+        options: Optional[Dict[str, Any]] = None,
+    ) -> Dict[str, Any]:
+        """Возвращает ответ в виде {"model": ..., "message": {"role", "content"}}.
+
+        Без явной модели запрос проходит через роутер: быстрая модель получает
+        свой бюджет времени, а при таймауте или пустом ответе запрос уходит
+        в сильную модель.
+        """
+        options = {**self.options, **(options or {})}
+        if model or self.router is None:
+            return await self._chat_model(messages, user_id, model or self.model, options)
+
+        route = self.router.classify(messages)
+        logger.info(
+            "🧭 [%s] Маршрут %s: %s", user_id, route.name, route.model,
+            extra={"user_id": user_id, "stage": "llm_route"}
+        )
+        if route is self.router.fast:
+            try:
+                response = await asyncio.wait_for(
+                    self._chat_model(messages, user_id, route.model, options), route.budget
+                )
+                if response["message"]["content"].strip():
+                    return response
+                logger.warning(
+                    "⚠️ %s вернула пустой ответ, переключаюсь на %s", route.model, self.router.strong.model,
+                    extra={"user_id": user_id, "stage": "llm_fallback"}
+                )
+            except asyncio.TimeoutError:
+                logger.warning(
+                    "⏱️ %s не уложилась в %sс, переключаюсь на %s", route.model, route.budget, self.router.strong.model,
+                    extra={"user_id": user_id, "stage": "llm_fallback"}
+                )
+            route = self.router.strong
+
+        started = time.monotonic()
+        response = await self._chat_model(messages, user_id, route.model, options)
+        elapsed = time.monotonic() - started
+        if elapsed > route.budget:
+            logger.warning(
+                "⏱️ %s превысила бюджет: %.1fс > %sс", route.model, elapsed, route.budget,
+                extra={"user_id": user_id, "stage": "llm_budget"}
+            )
+        return response
+
+    async def _chat_model(
+        self,
+        messages: List[Dict[str, str]],
+        user_id: Optional[int],
+        model: str,
+        options: Dict[str, Any],
+    ) -> Dict[str, Any]:
+        key = None
+        if self.cache is not None and self.cache.is_cacheable(options):
+            key = self.cache.make_key(model, messages, options)
+            cached = await self.cache.get(key)
+            if cached is not None:
+                logger.info(
+                    "⚡ Ответ LLM взят из кэша (%s)", model,
+                    extra={"user_id": user_id, "stage": "llm_cache_hit"}
+                )
+                return {**cached, "cached": True}
+
+        response = await self.gateway.chat(
+            user_id=user_id, model=model, messages=messages, options=options or None,
+            keep_alive=self.keep_alive
+        )
+        result = self._to_dict(response, model)
+
+        if key is not None and result["message"]["content"].strip():
+            await self.cache.set(key, result)
+        return result
+
+    @staticmethod
+    def _to_dict(response, model: str) -> Dict[str, Any]:
+        message = response.get("message") or {}
+        return {
+            "model": response.get("model") or model,
+            "message": {
+                "role": message.get("role") or "assistant",
+                "content": message.get("content") or "",
+            },
+            # Скорость генерации: eval_duration в наносекундах на eval_count токенов
+            "eval_count": response.get("eval_count"),
+            "eval_duration": response.get("eval_duration"),
+        }
@@ -0,0 +1,153 @@
+import asyncio
+import hashlib
+import httpx
+import ollama
+from typing import Any, List, Optional
+
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class OllamaEndpoint:
+    """Один сервер Ollama со своим пулом HTTP-соединений"""
+
+    def __init__(self, host: str, timeout: Optional[float] = None):
+        self.host = host
+        self.client = ollama.AsyncClient(host=host, timeout=timeout)
+        self.in_flight = 0
+        self.failures = 0
+        self.healthy = True
+
+    def __repr__(self) -> str:
+        return f"OllamaEndpoint({self.host}, in_flight={self.in_flight}, healthy={self.healthy})"
+
+
+class LLMGateway:
+    """Маршрутизация запросов между несколькими серверами Ollama.
+
+    Запрос уходит на сервер с наименьшим числом активных запросов; при этом
+    пользователь по возможности закрепляется за одним сервером, чтобы
+    переиспользовать кэш промпта. Недоступные серверы исключаются после
+    failure_threshold ошибок и возвращаются после успешной проверки здоровья.
+    """
+
+    def __init__(
+        self,
+        hosts: List[str],
+        timeout: Optional[float] = None,
+        health_interval: float = 15.0,
+        failure_threshold: int = 3,
+        affinity_slack: int = 1,
+    ):
+        if not hosts:
+            raise ValueError("Нужен хотя бы один сервер Ollama")
+        self.endpoints = [OllamaEndpoint(host, timeout) for host in hosts]
+        self.health_interval = health_interval
+        self.failure_threshold = failure_threshold
+        self.affinity_slack = affinity_slack
+        self._health_task: Optional[asyncio.Task] = None
+
+    def _affinity_score(self, user_id: int, endpoint: OllamaEndpoint) -> int:
+        digest = hashlib.md5(f"{user_id}:{endpoint.host}".encode()).digest()
+        return int.from_bytes(digest[:8], "big")
+
+    def pick(self, user_id: Optional[int] = None, exclude: Optional[OllamaEndpoint] = None) -> OllamaEndpoint:
+        """Выбирает сервер: свой для пользователя, если он не сильно загружен, иначе наименее загруженный"""
+        candidates = [e for e in self.endpoints if e.healthy and e is not exclude]
+        if not candidates:
+            candidates = [e for e in self.endpoints if e is not exclude] or self.endpoints
+
+        least_loaded = min(candidates, key=lambda e: e.in_flight)
+        if user_id is not None:
+            preferred = max(candidates, key=lambda e: self._affinity_score(user_id, e))
+            if preferred.in_flight <= least_loaded.in_flight + self.affinity_slack:
+                return preferred
+        return least_loaded
+
+    async def chat(self, user_id: Optional[int] = None, **kwargs) -> Any:
+        return await self._call("chat", user_id, **kwargs)
+
+    async def generate(self, user_id: Optional[int] = None, **kwargs) -> Any:
+        return await self._call("generate", user_id, **kwargs)
+
+    async def preload(self, model: str, keep_alive: Any = None, options: Optional[dict] = None) -> int:
+        """Загружает модель на всех доступных серверах; возвращает число успешных"""
+        endpoints = [e for e in self.endpoints if e.healthy] or self.endpoints
+        results = await asyncio.gather(*(
+            self._call_endpoint(e, "generate", model=model, prompt="", keep_alive=keep_alive, options=options)
+            for e in endpoints
+        ), return_exceptions=True)
+        for endpoint, result in zip(endpoints, results):
+            if isinstance(result, Exception):
+                logger.warning(f"⚠️ Не удалось загрузить {model} на {endpoint.host}: {result!r}")
+        return sum(not isinstance(r, Exception) for r in results)
+
+    async def _call(self, method: str, user_id: Optional[int], **kwargs) -> Any:
+        endpoint = self.pick(user_id)
+        try:
+            return await self._call_endpoint(endpoint, method, **kwargs)
+        except (ConnectionError, httpx.ConnectError):
+            # Запрос не дошёл до сервера — можно безопасно повторить на другом
+            if len(self.endpoints) == 1:
+                raise
+            retry = self.pick(user_id, exclude=endpoint)
+            logger.warning(f"⚠️ Ollama {endpoint.host} недоступна, повтор на {retry.host}")
+            return await self._call_endpoint(retry, method, **kwargs)
+
+    async def _call_endpoint(self, endpoint: OllamaEndpoint, method: str, **kwargs) -> Any:
+        endpoint.in_flight += 1
+        try:
+            response = await getattr(endpoint.client, method)(**kwargs)
+        except (ConnectionError, httpx.TransportError) as e:
+            self._record_failure(endpoint, e)
+            raise
+        except ollama.ResponseError as e:
+            if e.status_code >= 500:
+                self._record_failure(endpoint, e)
+            raise
+        finally:
+            endpoint.in_flight -= 1
+        endpoint.failures = 0
+        return response
+
+    def _record_failure(self, endpoint: OllamaEndpoint, error: Exception):
+        endpoint.failures += 1
+        if endpoint.healthy and endpoint.failures >= self.failure_threshold:
+            endpoint.healthy = False
+            logger.warning(f"🚫 Ollama {endpoint.host} исключена из балансировки: {error!r}")
+
+    async def check_health(self):
+        """Проверяет все серверы и возвращает восстановившиеся в балансировку"""
+        await asyncio.gather(*(self._check(e) for e in self.endpoints))
+
+    async def _check(self, endpoint: OllamaEndpoint):
+        try:
+            await asyncio.wait_for(endpoint.client.ps(), timeout=5)
+        except Exception as e:
+            self._record_failure(endpoint, e)
+            return
+        endpoint.failures = 0
+        if not endpoint.healthy:
+            endpoint.healthy = True
+            logger.info(f"✅ Ollama {endpoint.host} снова в балансировке")
+
+    async def _health_loop(self):
+        while True:
+            await asyncio.sleep(self.health_interval)
+            try:
+                await self.check_health()
+            except Exception as e:
+                logger.error(f"Ошибка проверки здоровья Ollama: {e}")
+
+    def start(self):
+        if self._health_task is None:
+            self._health_task = asyncio.create_task(self._health_loop())
+
+    async def close(self):
+        if self._health_task is not None:
+            self._health_task.cancel()
+            await asyncio.gather(self._health_task, return_exceptions=True)
+            self._health_task = None
+        for endpoint in self.endpoints:
+            await endpoint.client.close()
@@ -0,0 +1,43 @@
+from typing import Any, Dict, List, Optional, Tuple
+
+
+def select_history_window(
+    rows: List[Dict[str, Any]],
+    anchor: Optional[int],
+    max_messages: int,
+    max_chars: int,
+    keep_messages: int,
+) -> Tuple[List[Dict[str, str]], Optional[int]]:
+    """Окно истории, которое от хода к ходу только дописывается.
+
+    rows — сообщения с id >= anchor по возрастанию id (не больше max_messages + 1).
+    Пока окно укладывается в max_messages и max_chars, его начало (anchor)
+    не сдвигается, и Ollama переиспользует кэш промпта. При переполнении окно
+    сжимается сразу до keep_messages последних сообщений в пределах max_chars / 2,
+    чтобы следующие ходы снова только добавляли сообщения в конец.
+    Возвращает (история для промпта, новый anchor).
+    """
+    rows = [r for r in rows if r["content"] and r["content"].strip()]
+    total_chars = sum(len(r["content"].strip()) for r in rows)
+
+    overflow = anchor is None or len(rows) > max_messages or total_chars > max_chars
+    if overflow:
+        kept = []
+        kept_chars = 0
+        for r in reversed(rows):
+            length = len(r["content"].strip())
+            if kept and (len(kept) >= keep_messages or kept_chars + length > max_chars // 2):
+                break
+            kept.append(r)
+            kept_chars += length
+        rows = list(reversed(kept))
+        if rows:
+            anchor = rows[0]["id"]
+
+    history = [{"role": r["role"], "content": r["content"].strip()} for r in rows]
+    return history, anchor
+
+
+def build_messages(system_prompt: str, history: List[Dict[str, str]]) -> List[Dict[str, str]]:
+    """Системный промпт всегда первым, дальше история без изменений"""
+    return [{"role": "system", "content": system_prompt}, *history]
@@ -0,0 +1,57 @@
+import re
+from dataclasses import dataclass
+from typing import Dict, List, Optional
+
+from src.config.constants import COMPLEX_REQUEST_KEYWORDS
+
+
+@dataclass
+class Route:
+    name: str
+    model: str
+    budget: float  # секунды на генерацию
+
+
+class ModelRouter:
+    """Дешёвая классификация запроса: быстрая маленькая модель или сильная большая.
+
+    Решение принимается по последнему сообщению пользователя: в сильную модель
+    уходят длинные сообщения, код и запросы с ключевыми словами, требующими
+    рассуждения или развёрнутого ответа. Длина диалога — слабый сигнал: после
+    max_fast_history сообщений порог длины сообщения снижается вдвое, но короткие
+    реплики вроде «спасибо» по-прежнему идут в быструю модель.
+    """
+
+    def __init__(
+        self,
+        fast_model: str,
+        strong_model: str,
+        fast_budget: float = 10.0,
+        strong_budget: float = 120.0,
+        max_fast_chars: int = 160,
+        max_fast_history: int = 12,
+        keywords: Optional[List[str]] = None,
+    ):
+        self.fast = Route("fast", fast_model, fast_budget)
+        self.strong = Route("strong", strong_model, strong_budget)
+        self.max_fast_chars = max_fast_chars
+        self.max_fast_history = max_fast_history
+        keywords = keywords if keywords is not None else COMPLEX_REQUEST_KEYWORDS
+        self._keywords_re = re.compile(
+            r"\b(?:" + "|".join(re.escape(k) for k in keywords) + ")", re.IGNORECASE
+        ) if keywords else None
+
+    def classify(self, messages: List[Dict[str, str]]) -> Route:
+        dialog = [m for m in messages if m.get("role") != "system"]
+        last = next((m.get("content", "") for m in reversed(dialog) if m.get("role") == "user"), "")
+
+        max_chars = self.max_fast_chars
+        if len(dialog) > self.max_fast_history:
+            max_chars //= 2
+        if len(last) > max_chars:
+            return self.strong
+        if self._keywords_re is not None and self._keywords_re.search(last):
+            return self.strong
+        if "```" in last or last.count("\n") > 2:
+            return self.strong
+        return self.fast
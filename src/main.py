@@ -7,27 +7,142 @@ from telegram.ext import (
     filters
 )
 
-from src.config.settings import BOT_TOKEN, WHISPER_MODEL
+from src.config.settings import (
+    LOG_LEVEL, LOG_FILE, LOG_JSON, LOG_MAX_BYTES, LOG_BACKUP_COUNT, LOG_SAMPLE_RATES,
+    POSTGRES_POOL_MIN, POSTGRES_POOL_MAX, POSTGRES_REPLICA_HOSTS,
+    POSTGRES_READ_POOL_MIN, POSTGRES_READ_POOL_MAX, POSTGRES_READ_TIMEOUT, READ_YOUR_WRITES_TTL,
+    BOT_TOKEN, BOT_CONCURRENT_UPDATES, WHISPER_MODEL, WHISPER_DEGRADED_MODEL, VOICE_ENABLED,
+    WHISPER_PROFILE_PATH, WHISPER_SAMPLE_PATH, WHISPER_AUTOTUNE, WHISPER_WER_TOLERANCE,
+    SESSION_MAX_USERS, SESSION_IDLE_TTL, SESSION_MAX_BYTES,
+    ADMISSION_MAX_IN_FLIGHT, ADMISSION_THRESHOLDS, ADMISSION_MIN_DWELL,
+    STT_RTF_TARGET, LLM_TOKEN_TIME_TARGET, TTS_CHARS_TIME_TARGET,
+    RETENTION_INTERVAL, RETENTION_KEEP_LAST, RETENTION_BATCH_SIZE, MESSAGES_RETENTION_DAYS,
+    MODEL_NAME, LLM_OPTIONS, OLLAMA_KEEP_ALIVE, OLLAMA_KEEPALIVE_INTERVAL,
+    OLLAMA_HOSTS, OLLAMA_TIMEOUT, OLLAMA_HEALTH_INTERVAL,
+    FAST_MODEL_NAME, FAST_MODEL_BUDGET, STRONG_MODEL_BUDGET,
+    ROUTER_MAX_FAST_CHARS, ROUTER_MAX_FAST_HISTORY,
+    LLM_CACHE_ENABLED, LLM_CACHE_TTL, LLM_CACHE_MAX_ENTRIES, LLM_CACHE_MAX_BYTES,
+    LLM_CACHE_PERSIST, LLM_CACHE_SAMPLED, VOICE_CATALOG_PATH, VOICE_CATALOG_TTL,
+    TTS_HEDGE_DELAY, TTS_ATTEMPT_TIMEOUT, TTS_CHUNK_CHARS, TTS_CHUNK_CONCURRENCY,
+    TTS_CHUNK_CACHE_DIR
+)
 from src.database.repository import Database
+from src.database.retention import RetentionWorker
+from src.llm.cache import ResponseCache
+from src.llm.client import LLMClient
+from src.llm.gateway import LLMGateway
+from src.llm.router import ModelRouter
 from src.voice.tts_manager import EdgeTTSManager
+from src.voice.voice_catalog import VoiceCatalog
 from src.voice.stt_processor import STTProcessor
+from src.voice.stt_tuner import load_profile, tune
+from src.bot.admission import AdmissionController
 from src.bot.handlers import BotHandlers
-from src.utils.logger import setup_logging
+from src.bot.session import SessionStore
+from src.utils.logger import setup_logging, stop_logging, parse_sample_rates
 
 # Настройка логирования
-setup_logging()
+setup_logging(
+    log_level=LOG_LEVEL,
+    log_file=LOG_FILE,
+    json_format=LOG_JSON,
+    max_bytes=LOG_MAX_BYTES,
+    backup_count=LOG_BACKUP_COUNT,
+    sample_rates=parse_sample_rates(LOG_SAMPLE_RATES),
+)
 logger = logging.getLogger(__name__)
 
 # Глобальные переменные
-db = Database()
-tts_manager = EdgeTTSManager()
-stt_processor = STTProcessor(model_size=WHISPER_MODEL)
-handlers = BotHandlers(db, tts_manager, stt_processor)
+db = Database(
+    replica_hosts=POSTGRES_REPLICA_HOSTS,
+    pool_min=POSTGRES_POOL_MIN,
+    pool_max=POSTGRES_POOL_MAX,
+    read_pool_min=POSTGRES_READ_POOL_MIN,
+    read_pool_max=POSTGRES_READ_POOL_MAX,
+    pin_ttl=READ_YOUR_WRITES_TTL,
+    read_timeout=POSTGRES_READ_TIMEOUT,
+)
+retention = RetentionWorker(
+    db,
+    interval=RETENTION_INTERVAL,
+    keep_last=RETENTION_KEEP_LAST,
+    batch_size=RETENTION_BATCH_SIZE,
+    retention_days=MESSAGES_RETENTION_DAYS,
+    llm_cache_ttl=LLM_CACHE_TTL if LLM_CACHE_PERSIST else None,
+)
+tts_manager = EdgeTTSManager(
+    catalog=VoiceCatalog(VOICE_CATALOG_PATH, ttl=VOICE_CATALOG_TTL),
+    hedge_delay=TTS_HEDGE_DELAY,
+    attempt_timeout=TTS_ATTEMPT_TIMEOUT,
+    chunk_chars=TTS_CHUNK_CHARS,
+    chunk_concurrency=TTS_CHUNK_CONCURRENCY,
+    chunk_cache_dir=TTS_CHUNK_CACHE_DIR,
+)
+if WHISPER_AUTOTUNE and load_profile(WHISPER_PROFILE_PATH, WHISPER_MODEL) is None:
+    logger.info("⏱️ Подбираю параметры Whisper для этой машины...")
+    try:
+        tune(WHISPER_MODEL, WHISPER_SAMPLE_PATH, WHISPER_PROFILE_PATH, tolerance=WHISPER_WER_TOLERANCE)
+    except Exception as e:
+        logger.error(f"Не удалось подобрать параметры Whisper, использую стандартные: {e}")
+stt_processor = STTProcessor(
+    model_size=WHISPER_MODEL,
+    degraded_model_size=WHISPER_DEGRADED_MODEL,
+    profile_path=WHISPER_PROFILE_PATH,
+)
+llm_cache = ResponseCache(
+    ttl=LLM_CACHE_TTL,
+    max_entries=LLM_CACHE_MAX_ENTRIES,
+    max_bytes=LLM_CACHE_MAX_BYTES,
+    db=db if LLM_CACHE_PERSIST else None,
+    cache_sampled=LLM_CACHE_SAMPLED,
+) if LLM_CACHE_ENABLED else None
+llm_gateway = LLMGateway(
+    OLLAMA_HOSTS,
+    timeout=OLLAMA_TIMEOUT,
+    health_interval=OLLAMA_HEALTH_INTERVAL,
+)
+model_router = ModelRouter(
+    fast_model=FAST_MODEL_NAME,
+    strong_model=MODEL_NAME,
+    fast_budget=FAST_MODEL_BUDGET,
+    strong_budget=STRONG_MODEL_BUDGET,
+    max_fast_chars=ROUTER_MAX_FAST_CHARS,
+    max_fast_history=ROUTER_MAX_FAST_HISTORY,
+) if FAST_MODEL_NAME else None
+llm_client = LLMClient(
+    llm_gateway,
+    model=MODEL_NAME,
+    cache=llm_cache,
+    options=LLM_OPTIONS,
+    router=model_router,
+    keep_alive=OLLAMA_KEEP_ALIVE,
+    keepalive_interval=OLLAMA_KEEPALIVE_INTERVAL,
+)
+sessions = SessionStore(
+    max_sessions=SESSION_MAX_USERS,
+    idle_ttl=SESSION_IDLE_TTL,
+    max_bytes=SESSION_MAX_BYTES,
+    default_voice_enabled=VOICE_ENABLED,
+)
+admission = AdmissionController(
+    max_in_flight=ADMISSION_MAX_IN_FLIGHT,
+    stage_targets={"stt": STT_RTF_TARGET, "llm": LLM_TOKEN_TIME_TARGET, "tts": TTS_CHARS_TIME_TARGET},
+    thresholds=ADMISSION_THRESHOLDS,
+    min_dwell=ADMISSION_MIN_DWELL,
+)
+handlers = BotHandlers(db, tts_manager, stt_processor, llm_client, sessions, admission)
 
 async def post_init(application):
     """Инициализация после старта"""
     await db.init()
-    logger.info("✅ База данных подключена")
+    logger.info(f"✅ База данных подключена, реплик для чтения: {len(db.read_pools)}")
+    retention.start()
+    tts_manager.catalog.refresh_in_background()
+    stt_processor.load_degraded_in_background()
+    llm_gateway.start()
+    logger.info(f"✅ Серверы Ollama: {', '.join(OLLAMA_HOSTS)}")
+    await llm_client.warm_up()
+    llm_client.start_keepalive()
     logger.info(f"✅ Whisper модель: {WHISPER_MODEL}")
 
 async def shutdown(application):
@@ -38,12 +153,17 @@ async def shutdown(application):
     if application:
         await application.stop()
     
+    await llm_client.close()
+    await llm_gateway.close()
+    await retention.stop()
+    
     # Закрываем соединение с БД
     if db:
         await db.close()
         logger.info("✅ Соединение с БД закрыто")
     
     logger.info("👋 Бот остановлен")
+    stop_logging()
 
 def handle_exit(application):
     """Обработчик сигналов завершения"""
@@ -59,8 +179,11 @@ def handle_exit(application):
 def main():
     app = ApplicationBuilder()\
         .token(BOT_TOKEN)\
+        .concurrent_updates(BOT_CONCURRENT_UPDATES)\
         .post_init(post_init)\
         .build()
+    # Обновления, которые ещё не разобраны, тоже считаются нагрузкой
+    admission.queue_depth = app.update_queue.qsize
     
     # Регистрация обработчиков
     app.add_handler(CommandHandler("start", handlers.start))
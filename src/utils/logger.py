@@ -1,41 +1,154 @@
+import copy
+import json
 import logging
+import queue
+import random
 import sys
+from datetime import datetime, timezone
+from logging.handlers import QueueHandler, QueueListener, RotatingFileHandler
 from pathlib import Path
+from typing import Dict, Optional
+
+# Поля, которые можно передать через extra={...} для структурных логов
+STRUCTURED_FIELDS = ("user_id", "stage", "latency_ms")
+
+_listener: Optional[QueueListener] = None
+_queue_handler: Optional["StructuredQueueHandler"] = None
+
+
+class JsonFormatter(logging.Formatter):
+    """Форматирует запись в одну JSON-строку"""
+
+    def format(self, record: logging.LogRecord) -> str:
+        data = {
+            "ts": datetime.fromtimestamp(record.created, timezone.utc).isoformat(),
+            "level": record.levelname,
+            "logger": record.name,
+            "message": record.getMessage(),
+        }
+        for field in STRUCTURED_FIELDS:
+            value = getattr(record, field, None)
+            if value is not None:
+                data[field] = value
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self.formatException(record.exc_info)
+        if record.exc_text:
+            data["exc_info"] = record.exc_text
+        return json.dumps(data, ensure_ascii=False)
+
+
+class StructuredQueueHandler(QueueHandler):
+    """QueueHandler, который не вклеивает traceback в текст сообщения.
+
+    Стандартный prepare() форматирует запись целиком и очищает exc_info,
+    из-за чего JsonFormatter получал traceback внутри message. Здесь traceback
+    переносится в exc_text, который понимают и JsonFormatter, и logging.Formatter.
+    """
+
+    _exc_formatter = logging.Formatter()
+
+    def prepare(self, record: logging.LogRecord) -> logging.LogRecord:
+        record = copy.copy(record)
+        record.message = record.getMessage()
+        record.msg = record.message
+        record.args = None
+        if record.exc_info and not record.exc_text:
+            record.exc_text = self._exc_formatter.formatException(record.exc_info)
+        record.exc_info = None
+        return record
+
+
+class SamplingFilter(logging.Filter):
+    """Пропускает только долю записей ниже WARNING для заданных stage.
+
+    Ключ — поле stage из extra, а если его нет — имя логгера.
+    """
+
+    def __init__(self, rates: Dict[str, float]):
+        super().__init__()
+        self.rates = rates
+
+    def filter(self, record: logging.LogRecord) -> bool:
+        if record.levelno >= logging.WARNING:
+            return True
+        rate = self.rates.get(getattr(record, "stage", None) or record.name)
+        return rate is None or random.random() < rate
+
+
+def parse_sample_rates(value: str) -> Dict[str, float]:
+    """Разбирает строку вида "voice_received=0.1,llm_cache_hit=0.01" """
+    rates = {}
+    for item in (value or "").split(","):
+        if "=" in item:
+            key, rate = item.split("=", 1)
+            rates[key.strip()] = float(rate)
+    return rates
+
 
 def setup_logging(
     log_level: str = "INFO",
     log_file: str = "logs/bot.log",
-    format_string: str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s"
+    format_string: str = "%(asctime)s - %(name)s - %(levelname)s - %(message)s",
+    json_format: bool = False,
+    max_bytes: int = 10 * 1024 * 1024,
+    backup_count: int = 5,
+    sample_rates: Optional[Dict[str, float]] = None,
 ):
-    """Настройка логирования для всего приложения"""
-    
+    """Настройка логирования для всего приложения.
+
+    Логгеры пишут только в очередь, а файл и консоль обслуживает
+    QueueListener в фоновом потоке, поэтому event loop не ждёт диск.
+    """
+    global _listener, _queue_handler
+
     # Создаем папку для логов если её нет
     log_path = Path(log_file)
     log_path.parent.mkdir(parents=True, exist_ok=True)
-    
+
     # Настраиваем корневой логгер
     root_logger = logging.getLogger()
     root_logger.setLevel(getattr(logging, log_level.upper()))
-    
+
     # Форматтер
-    formatter = logging.Formatter(format_string)
-    
-    # Хендлер для файла
-    file_handler = logging.FileHandler(log_file, encoding='utf-8')
+    formatter = JsonFormatter() if json_format else logging.Formatter(format_string)
+
+    # Хендлер для файла с ротацией по размеру
+    file_handler = RotatingFileHandler(
+        log_file, maxBytes=max_bytes, backupCount=backup_count, encoding='utf-8'
+    )
     file_handler.setFormatter(formatter)
-    root_logger.addHandler(file_handler)
-    
+
     # Хендлер для консоли
     console_handler = logging.StreamHandler(sys.stdout)
     console_handler.setFormatter(formatter)
-    root_logger.addHandler(console_handler)
-    
+
+    # Хендлеры работают в фоновом потоке
+    stop_logging()
+    log_queue = queue.SimpleQueue()
+    _listener = QueueListener(log_queue, file_handler, console_handler, respect_handler_level=True)
+    _listener.start()
+
+    _queue_handler = StructuredQueueHandler(log_queue)
+    if sample_rates:
+        _queue_handler.addFilter(SamplingFilter(sample_rates))
+    root_logger.addHandler(_queue_handler)
+
     # Уменьшаем шум от некоторых библиотек
     logging.getLogger("httpx").setLevel(logging.WARNING)
     logging.getLogger("telegram").setLevel(logging.INFO)
-    
+
     logging.info("✅ Логирование настроено")
 
+def stop_logging():
+    """Дописывает очередь и останавливает фоновый поток логирования"""
+    global _listener, _queue_handler
+    if _queue_handler is not None:
+        logging.getLogger().removeHandler(_queue_handler)
+        _queue_handler = None
+    if _listener is not None:
+        _listener.stop()
+        _listener = None
+
 def get_logger(name: str) -> logging.Logger:
     """Получить логгер для модуля"""
-    return logging.getLogger(name)
\ No newline at end of file
+    return logging.getLogger(name)
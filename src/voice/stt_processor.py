@@ -1,11 +1,49 @@
+import threading
 from faster_whisper import WhisperModel
 from pathlib import Path
 from typing import Optional
 
+from src.utils.logger import get_logger
+from src.voice.stt_tuner import load_profile
+
+logger = get_logger(__name__)
+
 class STTProcessor:
-    def __init__(self, model_size: str = "base", device: str = "cpu"):
-        self.model = WhisperModel(model_size, device=device, compute_type="int8")
-    
-    def transcribe(self, audio_path: Path, language: str = "ru") -> str:
-        segments, _ = self.model.transcribe(str(audio_path), language=language)
-        return " ".join(segment.text for segment in segments).strip()
\ No newline at end of file
+    def __init__(
+        self,
+        model_size: str = "base",
+        device: str = "cpu",
+        degraded_model_size: Optional[str] = None,
+        profile_path: Optional[Path] = None,
+    ):
+        # Параметры из профиля stt_tuner, если он снят на этой машине
+        profile = load_profile(profile_path, model_size, device) if profile_path else None
+        self.beam_size = profile.pop("beam_size") if profile else 5
+        self.model_kwargs = profile or {"compute_type": "int8"}
+        self.model = WhisperModel(model_size, device=device, **self.model_kwargs)
+        self.device = device
+        self.degraded_model_size = degraded_model_size
+        self._degraded_model: Optional[WhisperModel] = None
+        self._loader: Optional[threading.Thread] = None
+
+    def load_degraded_in_background(self) -> Optional[threading.Thread]:
+        """Загружает меньшую модель заранее, а не в момент перегрузки"""
+        if self.degraded_model_size and self._loader is None:
+            self._loader = threading.Thread(target=self._load_degraded, name="whisper-degraded", daemon=True)
+            self._loader.start()
+        return self._loader
+
+    def _load_degraded(self):
+        try:
+            self._degraded_model = WhisperModel(
+                self.degraded_model_size, device=self.device, **self.model_kwargs
+            )
+            logger.info(f"✅ Запасная модель Whisper {self.degraded_model_size} загружена")
+        except Exception as e:
+            logger.error(f"Не удалось загрузить запасную модель Whisper {self.degraded_model_size}: {e}")
+
+    def transcribe(self, audio_path: Path, language: str = "ru", degraded: bool = False) -> str:
+        # Пока меньшая модель не загружена, распознаём основной
+        model = self._degraded_model if degraded and self._degraded_model is not None else self.model
+        segments, _ = model.transcribe(str(audio_path), language=language, beam_size=self.beam_size)
+        return " ".join(segment.text for segment in segments).strip()
@@ -0,0 +1,196 @@
+"""Подбор параметров faster-whisper под конкретную машину.
+
+Прогоняет эталонную запись через сетку compute_type, cpu_threads, num_workers
+и beam_size и сохраняет самый быстрый вариант, точность которого (WER) не хуже
+лучшего более чем на tolerance. STTProcessor подхватывает профиль при старте.
+
+Запуск: python -m src.voice.stt_tuner --model base
+"""
+
+import argparse
+import asyncio
+import edge_tts
+import json
+import os
+import re
+import time
+from concurrent.futures import ThreadPoolExecutor
+from datetime import datetime
+from itertools import groupby
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_PROFILE_PATH = "temp/whisper_profile.json"
+DEFAULT_SAMPLE_PATH = "temp/whisper_sample.mp3"
+SAMPLE_VOICE = "ru-RU-SvetlanaNeural"
+# Эталонный текст: запись синтезируется из него, поэтому WER считается честно
+SAMPLE_TEXT = (
+    "Привет! Напомни мне, пожалуйста, завтра в девять утра позвонить маме. "
+    "А ещё расскажи, какая погода будет на выходных в Москве и стоит ли брать зонт. "
+    "Спасибо, что помогаешь мне с делами каждый день."
+)
+RUNTIME_KEYS = ("compute_type", "cpu_threads", "num_workers", "beam_size")
+
+
+def normalize_words(text: str) -> List[str]:
+    return re.findall(r"\w+", text.lower().replace("ё", "е"))
+
+
+def word_error_rate(reference: str, hypothesis: str) -> float:
+    """Доля ошибок по словам: расстояние Левенштейна / число слов эталона"""
+    ref, hyp = normalize_words(reference), normalize_words(hypothesis)
+    if not ref:
+        return float(bool(hyp))
+    previous = list(range(len(hyp) + 1))
+    for i, r in enumerate(ref, 1):
+        current = [i]
+        for j, h in enumerate(hyp, 1):
+            current.append(min(previous[j] + 1, current[j - 1] + 1, previous[j - 1] + (r != h)))
+        previous = current
+    return previous[-1] / len(ref)
+
+
+async def ensure_sample(path: Path, text: str = SAMPLE_TEXT, voice: str = SAMPLE_VOICE) -> Path:
+    """Эталонная запись; при отсутствии синтезируется через Edge TTS"""
+    path = Path(path)
+    if not path.exists():
+        path.parent.mkdir(parents=True, exist_ok=True)
+        tmp_path = path.with_name(path.name + ".tmp")
+        await edge_tts.Communicate(text, voice).save(str(tmp_path))
+        os.replace(tmp_path, path)
+    return path
+
+
+def candidate_configs(cpu_count: Optional[int] = None, compute_types: Optional[List[str]] = None) -> List[Dict[str, Any]]:
+    """Сетка параметров без переподписки ядер (cpu_threads * num_workers <= cpu_count)"""
+    cpu_count = cpu_count or os.cpu_count() or 1
+    if compute_types is None:
+        import ctranslate2
+        supported = ctranslate2.get_supported_compute_types("cpu")
+        compute_types = [t for t in ("int8", "int8_float32", "float32") if t in supported]
+    threads = sorted({t for t in (2, 4, 8, cpu_count // 2, cpu_count) if 1 <= t <= cpu_count} or {1})
+    return [
+        {"compute_type": c, "cpu_threads": t, "num_workers": w, "beam_size": b}
+        for c in compute_types
+        for t in threads
+        for w in (1, 2)
+        for b in (1, 5)
+        if t * w <= cpu_count
+    ]
+
+
+def _transcribe(model, sample: Path, beam_size: int) -> str:
+    segments, _ = model.transcribe(str(sample), language="ru", beam_size=beam_size)
+    return " ".join(segment.text for segment in segments).strip()
+
+
+def benchmark(
+    model_size: str,
+    sample: Path,
+    reference: str,
+    candidates: List[Dict[str, Any]],
+    device: str = "cpu",
+    repeats: int = 2,
+) -> List[Dict[str, Any]]:
+    """Замеряет время на запись и WER для каждого варианта.
+
+    Модель загружается один раз на (compute_type, cpu_threads, num_workers);
+    при num_workers > 1 записи распознаются параллельно, как под нагрузкой в боте.
+    """
+    from faster_whisper import WhisperModel
+
+    def model_key(c):
+        return c["compute_type"], c["cpu_threads"], c["num_workers"]
+
+    results = []
+    for (compute_type, cpu_threads, num_workers), group in groupby(sorted(candidates, key=model_key), key=model_key):
+        model = WhisperModel(
+            model_size, device=device, compute_type=compute_type,
+            cpu_threads=cpu_threads, num_workers=num_workers,
+        )
+        with ThreadPoolExecutor(max_workers=num_workers) as pool:
+            for config in group:
+                text = _transcribe(model, sample, config["beam_size"])  # прогрев
+                started = time.perf_counter()
+                for _ in range(repeats):
+                    list(pool.map(lambda _: _transcribe(model, sample, config["beam_size"]), range(num_workers)))
+                seconds = (time.perf_counter() - started) / (repeats * num_workers)
+                result = {**config, "seconds_per_clip": round(seconds, 3), "wer": round(word_error_rate(reference, text), 4)}
+                logger.info(f"⏱️ Whisper {result}")
+                results.append(result)
+        del model
+    return results
+
+
+def select_best(results: List[Dict[str, Any]], tolerance: float) -> Dict[str, Any]:
+    """Самый быстрый вариант с WER не хуже лучшего + tolerance"""
+    best_wer = min(r["wer"] for r in results)
+    accurate = [r for r in results if r["wer"] <= best_wer + tolerance]
+    return min(accurate, key=lambda r: r["seconds_per_clip"])
+
+
+def load_profile(path: Path, model_size: str, device: str = "cpu") -> Optional[Dict[str, Any]]:
+    """Профиль для этой модели и этой машины; чужой или битый игнорируется"""
+    path = Path(path)
+    if not path.exists():
+        return None
+    try:
+        profile = json.loads(path.read_text(encoding="utf-8"))
+        if (profile["model"], profile["device"], profile["cpu_count"]) != (model_size, device, os.cpu_count()):
+            logger.info(f"Профиль Whisper {path} снят для другой модели или машины, не используется")
+            return None
+        return {key: profile[key] for key in RUNTIME_KEYS}
+    except (OSError, ValueError, KeyError) as e:
+        logger.warning(f"⚠️ Не удалось прочитать профиль Whisper {path}: {e}")
+        return None
+
+
+def tune(
+    model_size: str,
+    sample_path: Path = DEFAULT_SAMPLE_PATH,
+    profile_path: Path = DEFAULT_PROFILE_PATH,
+    tolerance: float = 0.05,
+    device: str = "cpu",
+    repeats: int = 2,
+) -> Dict[str, Any]:
+    """Подбирает параметры и сохраняет профиль; возвращает выбранный вариант"""
+    sample = asyncio.run(ensure_sample(sample_path))
+    results = benchmark(model_size, sample, SAMPLE_TEXT, candidate_configs(), device=device, repeats=repeats)
+    best = select_best(results, tolerance)
+
+    profile = {
+        "model": model_size,
+        "device": device,
+        "cpu_count": os.cpu_count(),
+        **best,
+        "tuned_at": datetime.now().isoformat(timespec="seconds"),
+    }
+    profile_path = Path(profile_path)
+    profile_path.parent.mkdir(parents=True, exist_ok=True)
+    tmp_path = profile_path.with_name(profile_path.name + ".tmp")
+    tmp_path.write_text(json.dumps(profile, ensure_ascii=False, indent=2), encoding="utf-8")
+    os.replace(tmp_path, profile_path)
+    logger.info(f"✅ Профиль Whisper сохранён в {profile_path}: {best}")
+    return best
+
+
+def main():
+    parser = argparse.ArgumentParser(description="Подбор параметров faster-whisper")
+    parser.add_argument("--model", default="base", help="размер модели Whisper")
+    parser.add_argument("--device", default="cpu")
+    parser.add_argument("--sample", default=DEFAULT_SAMPLE_PATH, help="эталонная запись (создаётся при отсутствии)")
+    parser.add_argument("--profile", default=DEFAULT_PROFILE_PATH, help="куда сохранить профиль")
+    parser.add_argument("--tolerance", type=float, default=0.05, help="допустимый рост WER")
+    parser.add_argument("--repeats", type=int, default=2)
+    args = parser.parse_args()
+
+    best = tune(args.model, args.sample, args.profile, args.tolerance, args.device, args.repeats)
+    print(json.dumps(best, ensure_ascii=False, indent=2))
+
+
+if __name__ == "__main__":
+    main()
@@ -1,33 +1,70 @@
+import asyncio
 import edge_tts
 import hashlib
+import math
+import os
+import shutil
+import time
 from pathlib import Path
 import tempfile
-from typing import Dict, Optional
+from typing import Dict, List, Optional, Tuple
+
+from src.utils.helpers import split_text
+from src.voice.audio_utils import safe_unlink
+from src.voice.voice_catalog import VoiceCatalog
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+DEFAULT_VOICES = {
+    "ru-RU-DmitryNeural": "Male",
+    "ru-RU-SvetlanaNeural": "Female",
+    "ru-RU-CatherineNeural": "Female",
+    "ru-RU-MarinaNeural": "Female",
+    "ru-RU-MikhailNeural": "Male",
+    "ru-RU-AndreyNeural": "Male",
+}
 
 class EdgeTTSManager:
-    def __init__(self, temp_dir: Path = None):
+    def __init__(
+        self,
+        temp_dir: Path = None,
+        catalog: VoiceCatalog = None,
+        hedge_delay: float = 2.0,
+        attempt_timeout: float = 20.0,
+        chunk_chars: int = 400,
+        chunk_concurrency: int = 4,
+        chunk_cache_dir: Optional[Path] = None,
+        chunk_cache_max_files: int = 500,
+    ):
         self.temp_dir = temp_dir or Path(tempfile.gettempdir())
-        self.available_voices = {
-            "ru-RU-DmitryNeural": "Male",
-            "ru-RU-SvetlanaNeural": "Female",
-            "ru-RU-CatherineNeural": "Female",
-            "ru-RU-MarinaNeural": "Female",
-            "ru-RU-MikhailNeural": "Male",
-            "ru-RU-AndreyNeural": "Male",
-        }
+        self.hedge_delay = hedge_delay
+        self.attempt_timeout = attempt_timeout
+        self.chunk_chars = chunk_chars
+        self.chunk_cache_dir = Path(chunk_cache_dir) if chunk_cache_dir else None
+        self.chunk_cache_max_files = chunk_cache_max_files
+        self.chunk_concurrency = chunk_concurrency
+        if self.chunk_cache_dir:
+            self.chunk_cache_dir.mkdir(parents=True, exist_ok=True)
+        self.health = VoiceHealth()
+        self.catalog = catalog or VoiceCatalog(self.temp_dir / "edge_tts_voices.json")
+        self.catalog.load_snapshot()
+        self.available_voices = self._build_available_voices(self.catalog.voices)
+        self._catalog_version = self.catalog.fetched_at
         self.default_voice = "ru-RU-SvetlanaNeural"
-        self.voice_preferences: Dict[int, str] = {}
+    
+    @staticmethod
+    def _build_available_voices(voices: list) -> Dict[str, str]:
+        available = dict(DEFAULT_VOICES)
+        available.update({v['ShortName']: v['Gender'] for v in voices})
+        return available
     
     async def get_available_voices(self, locale: str = "ru-RU"):
-        try:
-            voices = await edge_tts.list_voices()
-            russian_voices = [v for v in voices if locale in v['Locale']]
-            for v in russian_voices:
-                self.available_voices[v['ShortName']] = v['Gender']
-            return russian_voices
-        except Exception as e:
-            print(f"⚠️ Error getting voices: {e}")
-            return []
+        voices = await self.catalog.get_voices(locale)
+        if self.catalog.fetched_at != self._catalog_version:
+            self.available_voices = self._build_available_voices(self.catalog.voices)
+            self._catalog_version = self.catalog.fetched_at
+        return voices
     
     async def text_to_speech(self, text: str, user_id: int, voice: str = None) -> Optional[Path]:
         if not text or not text.strip():
@@ -39,32 +76,165 @@ class EdgeTTSManager:
         if mp3_path.exists():
             mp3_path.unlink()
         
-        voices_to_try = self._get_voice_priority(user_id, voice)
+        voices_to_try = self._get_voice_priority(voice)
+        # Голоса, которые сейчас падают, пробуем только если других не осталось
+        healthy = [v for v in voices_to_try if self.health.is_healthy(v)]
+        voices_to_try = healthy + [v for v in voices_to_try if v not in healthy]
+        
+        chunks = split_text(text, self.chunk_chars)
+        attempt_voice = await self._hedged_synthesis(chunks, voices_to_try, mp3_path)
+        if attempt_voice is None:
+            return None
+        return mp3_path
+    
+    async def _synthesize(self, chunks: List[str], voice: str, path: Path) -> Path:
+        """Синтезирует куски параллельно и склеивает их по порядку в один mp3.
         
-        for attempt_voice in voices_to_try:
-            try:
-                communicate = edge_tts.Communicate(
-                    text[:1000],
-                    attempt_voice,
-                    rate="+0%",
-                    volume="+0%",
-                    pitch="+0Hz"
+        У каждой попытки свой лимит параллельных кусков, чтобы зависший голос
+        не занимал слоты запасных голосов и других пользователей.
+        """
+        semaphore = asyncio.Semaphore(self.chunk_concurrency)
+        if len(chunks) == 1:
+            await self._synthesize_chunk(chunks[0], voice, path, semaphore)
+            return path
+        
+        chunk_paths = [path.with_name(f"{path.stem}_part{i}.mp3") for i in range(len(chunks))]
+        tasks = [
+            asyncio.create_task(self._synthesize_chunk(chunk, voice, chunk_path, semaphore))
+            for chunk, chunk_path in zip(chunks, chunk_paths)
+        ]
+        try:
+            await asyncio.gather(*tasks)
+            # Edge TTS отдаёт mp3 без заголовков, поэтому фреймы можно просто склеить
+            with open(path, 'wb') as out:
+                for chunk_path in chunk_paths:
+                    out.write(chunk_path.read_bytes())
+        finally:
+            for task in tasks:
+                task.cancel()
+            await asyncio.gather(*tasks, return_exceptions=True)
+            for chunk_path in chunk_paths:
+                safe_unlink(chunk_path)
+        return path
+    
+    async def _synthesize_chunk(self, text: str, voice: str, path: Path, semaphore: asyncio.Semaphore):
+        cache_path = self._chunk_cache_path(text, voice)
+        if cache_path and cache_path.exists():
+            shutil.copyfile(cache_path, path)
+            os.utime(cache_path)
+            return
+        
+        async with semaphore:
+            # Таймаут отсчитывается после захвата слота: ожидание очереди — не сбой голоса
+            await asyncio.wait_for(self._fetch_chunk(text, voice, path), self.attempt_timeout)
+        if not path.exists() or path.stat().st_size <= 1000:
+            raise RuntimeError(f"Слишком маленький аудиофайл от {voice}")
+        
+        if cache_path:
+            self._store_chunk(path, cache_path)
+    
+    async def _fetch_chunk(self, text: str, voice: str, path: Path):
+        communicate = edge_tts.Communicate(
+            text,
+            voice,
+            rate="+0%",
+            volume="+0%",
+            pitch="+0Hz"
+        )
+        await communicate.save(str(path))
+    
+    def _chunk_cache_path(self, text: str, voice: str) -> Optional[Path]:
+        if not self.chunk_cache_dir:
+            return None
+        key = hashlib.sha1(f"{voice}\n{text}".encode()).hexdigest()
+        return self.chunk_cache_dir / f"{key}.mp3"
+    
+    def _store_chunk(self, path: Path, cache_path: Path):
+        try:
+            tmp_path = cache_path.with_suffix(".tmp")
+            shutil.copyfile(path, tmp_path)
+            tmp_path.replace(cache_path)
+            
+            cached = list(self.chunk_cache_dir.glob("*.mp3"))
+            if len(cached) > self.chunk_cache_max_files:
+                cached.sort(key=lambda p: p.stat().st_mtime)
+                for old in cached[:len(cached) - self.chunk_cache_max_files]:
+                    safe_unlink(old)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось сохранить кусок TTS в кэш: {e}")
+    
+    async def _hedged_synthesis(self, chunks: List[str], voices: List[str], mp3_path: Path) -> Optional[str]:
+        """Синтез с подстраховкой.
+        
+        Основной голос получает hedge_delay секунд на каждую волну кусков;
+        если он не успел, параллельно запускается следующий. Ошибка сразу
+        запускает следующий голос. Побеждает
+        первый валидный результат, остальные попытки отменяются.
+        Возвращает имя сработавшего голоса, файл кладётся в mp3_path.
+        """
+        queue = list(voices)
+        # Куски одной попытки идут волнами по chunk_concurrency штук, поэтому
+        # длинный ответ здорового голоса не должен запускать запасной
+        hedge_delay = self.hedge_delay * math.ceil(len(chunks) / self.chunk_concurrency)
+        attempts: Dict[asyncio.Task, Tuple[str, Path]] = {}
+        pending = set()
+        
+        def launch():
+            attempt_voice = queue.pop(0)
+            path = mp3_path.with_name(f"{mp3_path.stem}_{attempt_voice}.mp3")
+            task = asyncio.create_task(self._synthesize(chunks, attempt_voice, path))
+            attempts[task] = (attempt_voice, path)
+            pending.add(task)
+        
+        winner = None
+        try:
+            if queue:
+                launch()
+            while pending and winner is None:
+                done, _ = await asyncio.wait(
+                    pending,
+                    timeout=hedge_delay if queue else None,
+                    return_when=asyncio.FIRST_COMPLETED
                 )
-                await communicate.save(str(mp3_path))
+                if not done:
+                    logger.info(
+                        "⏱️ TTS не уложился в %sс, запускаю запасной голос", hedge_delay,
+                        extra={"stage": "tts_hedge"}
+                    )
+                    launch()
+                    continue
+                
+                failed = False
+                for task in done:
+                    pending.discard(task)
+                    attempt_voice, path = attempts[task]
+                    if task.exception() is None and winner is None:
+                        self.health.record_success(attempt_voice)
+                        path.replace(mp3_path)
+                        winner = attempt_voice
+                    elif task.exception() is not None:
+                        logger.warning(f"⚠️ Голос {attempt_voice} не сработал: {task.exception()!r}")
+                        self.health.record_failure(attempt_voice)
+                        safe_unlink(path)
+                        failed = True
+                    else:
+                        safe_unlink(path)
                 
-                if mp3_path.exists() and mp3_path.stat().st_size > 1000:
-                    if voice != attempt_voice and user_id not in self.voice_preferences:
-                        self.voice_preferences[user_id] = attempt_voice
-                    return mp3_path
-            except Exception:
-                continue
+                if winner is None and failed and queue:
+                    launch()
+        finally:
+            for task in pending:
+                task.cancel()
+            if pending:
+                await asyncio.gather(*pending, return_exceptions=True)
+            for task in pending:
+                safe_unlink(attempts[task][1])
         
-        return None
+        return winner
     
-    def _get_voice_priority(self, user_id: int, voice: Optional[str]) -> list:
-        preferred = voice or self.voice_preferences.get(user_id)
+    def _get_voice_priority(self, voice: Optional[str]) -> list:
         priority = [
-            preferred,
+            voice,
             "ru-RU-SvetlanaNeural",
             "ru-RU-DmitryNeural",
             "ru-RU-CatherineNeural",
@@ -72,4 +242,28 @@ class EdgeTTSManager:
             "ru-RU-MikhailNeural",
             "ru-RU-AndreyNeural",
         ]
-        return [v for v in priority if v and v in self.available_voices]
\ No newline at end of file
+        return [v for v in dict.fromkeys(priority) if v and v in self.available_voices]
+
+
+class VoiceHealth:
+    """Отслеживает сбои голосов и временно исключает падающие"""
+    
+    def __init__(self, failure_threshold: int = 2, cooldown: float = 60.0):
+        self.failure_threshold = failure_threshold
+        self.cooldown = cooldown
+        self._failures: Dict[str, int] = {}
+        self._skip_until: Dict[str, float] = {}
+    
+    def is_healthy(self, voice: str) -> bool:
+        return self._skip_until.get(voice, 0.0) <= time.monotonic()
+    
+    def record_success(self, voice: str):
+        self._failures.pop(voice, None)
+        self._skip_until.pop(voice, None)
+    
+    def record_failure(self, voice: str):
+        failures = self._failures.get(voice, 0) + 1
+        self._failures[voice] = failures
+        if failures >= self.failure_threshold:
+            self._skip_until[voice] = time.monotonic() + self.cooldown
+            logger.warning(f"🚫 Голос {voice} временно исключён на {self.cooldown:.0f}с")
\ No newline at end of file
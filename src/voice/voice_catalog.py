@@ -0,0 +1,100 @@
+import asyncio
+import json
+import time
+import edge_tts
+from pathlib import Path
+from typing import Dict, List, Optional
+
+from src.utils.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+class VoiceCatalog:
+    """Кэш каталога голосов Edge TTS.
+
+    Хранит снимок на диске, обновляет его не чаще раза в ttl секунд
+    и объединяет параллельные обновления в один сетевой запрос.
+    """
+
+    def __init__(self, snapshot_path: Path, ttl: int = 24 * 3600):
+        self.snapshot_path = Path(snapshot_path)
+        self.ttl = ttl
+        self.fetched_at = 0.0
+        self._voices: List[dict] = []
+        self._by_locale: Dict[str, List[dict]] = {}
+        self._refresh_task: Optional[asyncio.Task] = None
+
+    @property
+    def voices(self) -> List[dict]:
+        return self._voices
+
+    def is_stale(self) -> bool:
+        return time.time() - self.fetched_at > self.ttl
+
+    def load_snapshot(self) -> bool:
+        """Загружает снимок каталога с диска"""
+        try:
+            data = json.loads(self.snapshot_path.read_text(encoding="utf-8"))
+            self._set_voices(data["voices"], data.get("fetched_at", 0.0))
+            logger.info(f"✅ Каталог голосов загружен из {self.snapshot_path}: {len(self._voices)} голосов")
+            return True
+        except FileNotFoundError:
+            return False
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось прочитать снимок голосов: {e}")
+            return False
+
+    def _save_snapshot(self):
+        try:
+            self.snapshot_path.parent.mkdir(parents=True, exist_ok=True)
+            tmp_path = self.snapshot_path.with_suffix(".tmp")
+            tmp_path.write_text(
+                json.dumps({"fetched_at": self.fetched_at, "voices": self._voices}, ensure_ascii=False),
+                encoding="utf-8",
+            )
+            tmp_path.replace(self.snapshot_path)
+        except Exception as e:
+            logger.warning(f"⚠️ Не удалось сохранить снимок голосов: {e}")
+
+    def _set_voices(self, voices: List[dict], fetched_at: float):
+        by_locale: Dict[str, List[dict]] = {}
+        for v in voices:
+            locale = v.get("Locale", "")
+            by_locale.setdefault(locale, []).append(v)
+            language = locale.split("-")[0]
+            if language != locale:
+                by_locale.setdefault(language, []).append(v)
+        # Подменяем ссылки целиком, а не мутируем структуры на месте
+        self._voices = voices
+        self._by_locale = by_locale
+        self.fetched_at = fetched_at
+
+    async def refresh(self) -> List[dict]:
+        """Обновляет каталог; параллельные вызовы ждут один и тот же запрос"""
+        if self._refresh_task is None or self._refresh_task.done():
+            self._refresh_task = asyncio.create_task(self._fetch())
+        return await asyncio.shield(self._refresh_task)
+
+    def refresh_in_background(self):
+        """Запускает обновление, если каталог устарел, не дожидаясь результата"""
+        if self.is_stale() and (self._refresh_task is None or self._refresh_task.done()):
+            self._refresh_task = asyncio.create_task(self._fetch())
+
+    async def _fetch(self) -> List[dict]:
+        try:
+            voices = await edge_tts.list_voices()
+        except Exception as e:
+            logger.warning(f"⚠️ Ошибка получения списка голосов: {e}")
+            return self._voices
+        self._set_voices(voices, time.time())
+        self._save_snapshot()
+        return self._voices
+
+    async def get_voices(self, locale: str = "ru-RU") -> List[dict]:
+        """Голоса для локали; сеть нужна только если каталог ещё пуст"""
+        if not self._voices:
+            await self.refresh()
+        else:
+            self.refresh_in_background()
+        return list(self._by_locale.get(locale, []))
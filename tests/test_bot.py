@@ -0,0 +1,247 @@
+import asyncio
+import pytest
+from types import SimpleNamespace
+from src.bot.admission import AdmissionController, DegradationLevel
+from src.bot.handlers import BotHandlers
+from src.bot.session import SessionStore
+from src.bot.status import StatusMessage
+
+class FakeChat:
+    def __init__(self):
+        self.actions = []
+
+    async def send_action(self, action):
+        self.actions.append(action)
+
+class FakeMessage:
+    def __init__(self):
+        self.chat = FakeChat()
+        self.sent = []
+        self.edits = []
+
+    async def reply_text(self, text):
+        self.sent.append(text)
+        return self
+
+    async def edit_text(self, text):
+        self.edits.append(text)
+
+@pytest.mark.asyncio
+async def test_status_message_coalesces_edits():
+    """Тест: одно сообщение, частые правки схлопываются до последней"""
+    source = FakeMessage()
+    status = StatusMessage(source, min_interval=0.05)
+
+    status.start("🎧 Распознаю речь...")
+    for i in range(10):
+        status.update(f"Шаг {i}")
+        await asyncio.sleep(0)
+    await status.finish("Готово")
+
+    assert source.sent == ["🎧 Распознаю речь..."]
+    assert source.edits[-1] == "Готово"
+    assert len(source.edits) <= 2
+    assert source.chat.actions[0] == "typing"
+
+@pytest.mark.asyncio
+async def test_status_message_without_text():
+    """Тест: без текста только обновляется индикатор действия"""
+    source = FakeMessage()
+    status = StatusMessage(source)
+
+    status.start()
+    await asyncio.sleep(0)
+    await status.finish()
+
+    assert source.sent == []
+    assert source.chat.actions == ["typing"]
+
+def test_session_store_lru_eviction():
+    """Тест вытеснения самых давно активных сессий"""
+    store = SessionStore(max_sessions=2)
+    store.get(1).voice = "ru-RU-DmitryNeural"
+    store.get(2)
+    store.get(1)
+    store.get(3)
+
+    assert len(store) == 2
+    assert store.peek(2) is None
+    assert store.peek(1).voice == "ru-RU-DmitryNeural"
+    assert store.stats()["evicted"] == 1
+
+def test_session_store_idle_eviction():
+    """Тест удаления сессий без активности"""
+    store = SessionStore(idle_ttl=60)
+    store.get(1)
+    store.peek(1).last_activity -= 120
+    store.get(2)
+
+    assert store.peek(1) is None
+    assert store.peek(2) is not None
+
+def test_session_store_memory_cap():
+    """Тест ограничения числа сессий по памяти"""
+    store = SessionStore(max_sessions=1_000_000, max_bytes=100 * 1024)
+    for user_id in range(10_000):
+        store.get(user_id)
+
+    assert len(store) == store.max_sessions < 10_000
+    assert store.size_bytes() <= 100 * 1024
+    assert not hasattr(store.get(1), "__dict__")
+
+def test_admission_degrades_step_by_step():
+    """Тест: уровень деградации растёт с нагрузкой, на REJECT запросы отклоняются"""
+    admission = AdmissionController(max_in_flight=2, alpha=1.0)
+
+    assert admission.try_enter() and admission.try_enter()
+    assert admission.level == DegradationLevel.NO_TTS
+
+    admission.record("llm", 0.55)  # 0.55 / 0.25 > 2.0
+    assert admission.level == DegradationLevel.SHORT_HISTORY
+
+    admission.record("stt", 1.6)  # 1.6 / 0.5 > 3.0
+    assert admission.level == DegradationLevel.REJECT
+    assert not admission.try_enter()
+    assert admission.in_flight == 2
+
+def test_admission_ignores_single_slow_request():
+    """Тест: одна долгая голосовая или длинный ответ не меняют уровень"""
+    admission = AdmissionController()
+    admission.record("stt", 35.0)  # 35 с распознавания одной голосовой в 10 с
+    admission.record("llm", 2.0)
+    admission.record("tts", 20.0)
+    assert admission.level == DegradationLevel.NORMAL
+    assert admission.try_enter()
+
+    for _ in range(10):
+        admission.record("stt", 3.5)
+    assert admission.level >= DegradationLevel.SHORT_HISTORY
+
+def test_admission_recovers_with_hysteresis():
+    """Тест: восстановление по одному уровню и не раньше min_dwell"""
+    admission = AdmissionController(max_in_flight=4, min_dwell=10, half_life=1e9, alpha=1.0)
+    admission.record("llm", 0.42)  # нагрузка 1.68 -> SMALL_STT
+    assert admission.level == DegradationLevel.SMALL_STT
+
+    admission.alpha = 0.3
+    admission.record("llm", 0.0)  # 0.294 / 0.25 = 1.18: ещё выше порога восстановления
+    admission._changed_at -= 60
+    admission.leave()
+    assert admission.level == DegradationLevel.SMALL_STT
+
+    for _ in range(10):
+        admission.record("llm", 0.0)
+    admission.leave()
+    assert admission.level == DegradationLevel.NO_TTS  # только один шаг за раз
+
+    admission.leave()
+    assert admission.level == DegradationLevel.NO_TTS  # min_dwell не прошёл
+
+def test_admission_latency_decays_without_samples():
+    """Тест: без новых замеров оценка затухает и уровень снижается"""
+    admission = AdmissionController(min_dwell=0, half_life=1.0, alpha=1.0)
+    admission.record("stt", 2.0)
+    assert admission.level == DegradationLevel.REJECT
+
+    admission._latency_at["stt"] -= 30
+    for _ in range(4):
+        admission.try_enter() and admission.leave()
+    assert admission.level == DegradationLevel.NORMAL
+
+class FakeDb:
+    def __init__(self):
+        self.calls = []
+        self.rows = [
+            {"id": 1, "role": "user", "content": "Привет"},
+            {"id": 2, "role": "assistant", "content": "Здравствуйте"},
+        ]
+
+    async def ensure_user(self, *args):
+        self.calls.append("ensure_user")
+
+    async def get_history_window(self, user_id, anchor_id, limit):
+        self.calls.append("get_history_window")
+        return [dict(r) for r in self.rows]
+
+    async def save_message(self, user_id, role, content, model=None):
+        self.calls.append(f"save_message:{role}")
+        self.rows.append({"id": len(self.rows) + 1, "role": role, "content": content})
+        return len(self.rows)
+
+class FakeLLM:
+    def __init__(self):
+        self.prompts = []
+
+    async def chat(self, messages, user_id=None):
+        self.prompts.append(messages)
+        return {"model": "test-model", "message": {"role": "assistant", "content": "Ответ"}}
+
+@pytest.mark.asyncio
+async def test_history_read_before_user_message_is_saved():
+    """Тест: окно истории читается до записи хода, а новое сообщение дописывается из памяти"""
+    db, llm = FakeDb(), FakeLLM()
+    handlers = BotHandlers(db, None, None, llm, SessionStore(default_voice_enabled=False))
+    message = FakeMessage()
+    message.text = "Как дела?"
+    update = SimpleNamespace(
+        effective_user=SimpleNamespace(id=1, username="u", first_name="U", last_name=None),
+        message=message,
+    )
+
+    await handlers.handle_text(update, None)
+
+    assert db.calls.index("get_history_window") < db.calls.index("save_message:user")
+    assert [m["content"] for m in llm.prompts[0][1:]] == ["Привет", "Здравствуйте", "Как дела?"]
+    assert message.sent == ["Ответ"]
+    assert handlers.sessions.peek(1).history_anchor == 1
+
+def test_admission_counts_update_queue():
+    """Тест: неразобранные обновления в очереди поднимают уровень"""
+    backlog = [0]
+    admission = AdmissionController(max_in_flight=4, queue_depth=lambda: backlog[0])
+    assert admission.try_enter()
+    assert admission.level == DegradationLevel.NORMAL
+
+    backlog[0] = 9  # (1 + 9) / 4 = 2.5
+    assert admission.try_enter()
+    assert admission.level == DegradationLevel.SHORT_HISTORY
+
+    backlog[0] = 20
+    assert not admission.try_enter()
+    assert admission.level == DegradationLevel.REJECT
+
+class SlowLLM(FakeLLM):
+    def __init__(self):
+        super().__init__()
+        self.release = asyncio.Event()
+
+    async def chat(self, messages, user_id=None):
+        await self.release.wait()
+        return await super().chat(messages, user_id)
+
+@pytest.mark.asyncio
+async def test_concurrent_requests_raise_level_and_reject():
+    """Тест: одновременные запросы поднимают уровень до отказа, после разгрузки он снижается"""
+    db, llm = FakeDb(), SlowLLM()
+    admission = AdmissionController(max_in_flight=2, min_dwell=0)
+    handlers = BotHandlers(db, None, None, llm, SessionStore(default_voice_enabled=False), admission)
+
+    def make_update(user_id):
+        message = FakeMessage()
+        message.text = "Привет"
+        user = SimpleNamespace(id=user_id, username="u", first_name="U", last_name=None)
+        return SimpleNamespace(effective_user=user, message=message)
+
+    updates = [make_update(i) for i in range(8)]
+    tasks = [asyncio.create_task(handlers.handle_text(u, None)) for u in updates]
+    await asyncio.sleep(0.05)
+
+    assert admission.level == DegradationLevel.REJECT
+    assert admission.in_flight == 6  # 6 / 2 = 3.0 — дальше запросы отклоняются
+    rejected = [u for u in updates if u.message.sent and u.message.sent[0].startswith("⏳")]
+    assert len(rejected) == 2
+
+    llm.release.set()
+    await asyncio.gather(*tasks)
+    assert admission.in_flight == 0
+    assert admission.level < DegradationLevel.REJECT
@@ -1,8 +1,9 @@
+import asyncio
 import pytest
 import pytest_asyncio
 import asyncpg
 from src.database.repository import Database
-from src.config.settings import DB_CONFIG
+from src.database.retention import RetentionWorker
 
 @pytest_asyncio.fixture
 async def db():
@@ -48,7 +49,7 @@ async def test_save_and_get_messages(db):
     await db.save_message(user_id, "assistant", "Здравствуйте", "test-model")
     
     # Получаем историю
-    history = await db.get_history(user_id)
+    history = await db.get_history_window(user_id, None, 10)
     
     assert len(history) == 2
     assert history[0]["role"] == "user"
@@ -57,18 +58,114 @@ async def test_save_and_get_messages(db):
     assert history[1]["content"] == "Здравствуйте"
 
 @pytest.mark.asyncio
-async def test_trim_history(db):
-    """Тест обрезки истории"""
+async def test_retention_trims_in_background(db):
+    """Тест фоновой обрезки истории вместо DELETE на каждом сообщении"""
+    for user_id in (12345, 12346):
+        await db.ensure_user(user_id, "test", "Test", "User")
+        for i in range(15):
+            await db.save_message(user_id, "user", f"Message {i}")
+    
+    # Пачки меньше числа лишних строк, чтобы проверить цикл удаления
+    worker = RetentionWorker(db, keep_last=10, batch_size=3)
+    await worker.run_once()
+    
+    for user_id in (12345, 12346):
+        stats = await db.get_user_stats(user_id)
+        assert stats['total'] == 10
+    history = await db.get_history_window(12345, None, 20)
+    assert [r["content"] for r in history] == [f"Message {i}" for i in range(5, 15)]
+
+@pytest.mark.asyncio
+async def test_drop_expired_partitions(db):
+    """Тест удаления старых месячных секций"""
+    if not db.partitioned:
+        pytest.skip("messages не секционирована")
+    
+    async with db.pool.acquire() as conn:
+        await conn.execute('''
+            CREATE TABLE IF NOT EXISTS messages_y2020m01 PARTITION OF messages
+            FOR VALUES FROM ('2020-01-01') TO ('2020-02-01')
+        ''')
+    
+    dropped = await db.drop_expired_partitions(retention_days=30)
+    assert dropped == ["messages_y2020m01"]
+
+
+@pytest.mark.asyncio
+async def test_get_history_window(db):
+    """Тест выборки окна истории от якоря"""
     user_id = 12345
     await db.ensure_user(user_id, "test", "Test", "User")
-    
-    # Сохраняем много сообщений
-    for i in range(25):
+    for i in range(10):
         await db.save_message(user_id, "user", f"Message {i}")
     
-    # Обрезаем до 10
-    await db.trim_history(user_id, keep_last=10)
+    latest = await db.get_history_window(user_id, None, 3)
+    assert [r["content"] for r in latest] == ["Message 7", "Message 8", "Message 9"]
+    
+    window = await db.get_history_window(user_id, latest[0]["id"], 100)
+    assert window == latest
+
+@pytest.mark.asyncio
+async def test_reads_pinned_to_primary_after_write(db):
+    """Тест: после записи пользователь читает с primary, потом с реплики"""
+    replica_db = Database(replica_hosts=[db.config["host"]], pin_ttl=60)
+    await replica_db.init()
+    try:
+        assert len(replica_db.read_pools) == 1
+        await replica_db.ensure_user(12345, "test", "Test", "User")
+        await replica_db.save_message(12345, "user", "Привет")
+        
+        assert replica_db._read_pool(12345) is None
+        assert replica_db._read_pool(12346) is replica_db.read_pools[0]
+        
+        replica_db._pinned[12345] -= 120
+        assert replica_db._read_pool(12345) is replica_db.read_pools[0]
+        history = await replica_db.get_history_window(12345, None, 10)
+        assert [(r["role"], r["content"]) for r in history] == [("user", "Привет")]
+    finally:
+        await replica_db.close()
+
+@pytest.mark.asyncio
+async def test_replica_failure_falls_back_to_primary(db):
+    """Тест: при ошибке реплики чтение повторяется на primary"""
+    await db.ensure_user(12345, "test", "Test", "User")
+    await db.save_message(12345, "user", "Привет")
+    
+    broken = await asyncpg.create_pool(**db.config, min_size=1, max_size=1)
+    await broken.close()
+    db.read_pools = [broken]
+    
+    stats = await db.get_user_stats(12345)
+    assert stats["total"] == 1
+    window = await db.get_history_window(12345, None, 10)
+    assert [r["content"] for r in window] == ["Привет"]
+
+class HangingPool:
+    """Реплика, которая принимает соединение и не отвечает"""
+
+    def acquire(self):
+        return self
+
+    async def __aenter__(self):
+        await asyncio.sleep(10)
+
+    async def __aexit__(self, *exc):
+        pass
+
+    async def close(self):
+        pass
+
+@pytest.mark.asyncio
+async def test_hanging_replica_times_out_to_primary(db):
+    """Тест: зависшая реплика не держит чтение дольше read_timeout"""
+    await db.ensure_user(12345, "test", "Test", "User")
+    first = await db.save_message(12345, "user", "Привет")
+    second = await db.save_message(12345, "assistant", "Здравствуйте")
+    assert second > first
+    
+    db.read_pools = [HangingPool()]
+    db.read_timeout = 0.1
+    db._pinned.clear()
     
-    # Проверяем
-    history = await db.get_history(user_id)
-    assert len(history) <= 10
\ No newline at end of file
+    window = await asyncio.wait_for(db.get_history_window(12345, None, 10), timeout=1)
+    assert [r["id"] for r in window] == [first, second]
@@ -0,0 +1,280 @@
+import httpx
+import json
+import threading
+import pytest
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from src.llm.cache import ResponseCache
+from src.llm.client import LLMClient
+from src.llm.gateway import LLMGateway
+from src.llm.prompt import build_messages, select_history_window
+from src.config.constants import HISTORY_MESSAGES_LIMIT, HISTORY_WINDOW_MAX, MAX_HISTORY_CHARS
+from src.llm.router import ModelRouter
+
+def make_response(content: str) -> dict:
+    return {"model": "test-model", "message": {"role": "assistant", "content": content}}
+
+@pytest.mark.asyncio
+async def test_cache_hit_after_set():
+    """Тест попадания в кэш"""
+    cache = ResponseCache(ttl=60)
+    messages = [{"role": "system", "content": "prompt"}, {"role": "user", "content": "Привет"}]
+    key = cache.make_key("test-model", messages)
+
+    assert await cache.get(key) is None
+    await cache.set(key, make_response("Здравствуйте"))
+
+    cached = await cache.get(key)
+    assert cached["message"]["content"] == "Здравствуйте"
+    assert cache.hits == 1
+    assert cache.misses == 1
+
+def test_cache_key_normalization():
+    """Тест нормализации пробелов и учёта модели/опций в ключе"""
+    a = [{"role": "user", "content": "  Привет   мир "}]
+    b = [{"role": "user", "content": "Привет мир"}]
+
+    assert ResponseCache.make_key("m", a) == ResponseCache.make_key("m", b)
+    assert ResponseCache.make_key("m", a) != ResponseCache.make_key("other", a)
+    assert ResponseCache.make_key("m", a) != ResponseCache.make_key("m", a, {"num_ctx": 4096})
+
+@pytest.mark.asyncio
+async def test_cache_lru_eviction():
+    """Тест вытеснения самых старых записей"""
+    cache = ResponseCache(ttl=60, max_entries=2)
+    await cache.set("a", make_response("a"))
+    await cache.set("b", make_response("b"))
+    await cache.get("a")
+    await cache.set("c", make_response("c"))
+
+    assert len(cache) == 2
+    assert await cache.get("b") is None
+    assert await cache.get("a") is not None
+
+@pytest.mark.asyncio
+async def test_cache_ttl_expiry():
+    """Тест истечения TTL"""
+    cache = ResponseCache(ttl=0)
+    await cache.set("a", make_response("a"))
+    cache._entries["a"] = (cache._entries["a"][0] - 1, *cache._entries["a"][1:])
+
+    assert await cache.get("a") is None
+    assert len(cache) == 0
+
+def test_cache_temperature_opt_out():
+    """Тест отказа от кэширования при temperature > 0 или без temperature"""
+    cache = ResponseCache()
+    assert not cache.is_cacheable(None)
+    assert not cache.is_cacheable({"num_ctx": 4096})
+    assert cache.is_cacheable({"temperature": 0})
+    assert not cache.is_cacheable({"temperature": 0.7})
+    assert ResponseCache(cache_sampled=True).is_cacheable({"temperature": 0.7})
+
+
+class StubOllamaHandler(BaseHTTPRequestHandler):
+    """Минимальный сервер Ollama: /api/chat и /api/ps"""
+
+    def _send(self, payload: dict):
+        body = json.dumps(payload).encode()
+        self.send_response(200)
+        self.send_header("Content-Type", "application/json")
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def do_GET(self):
+        self._send({"models": []})
+
+    def do_POST(self):
+        body = json.loads(self.rfile.read(int(self.headers.get("Content-Length", 0))))
+        self.server.calls.append((self.path, body))
+        self._send({
+            "model": "test-model",
+            "message": {"role": "assistant", "content": self.server.name},
+            "done": True,
+        })
+
+    def log_message(self, *args):
+        pass
+
+@pytest.fixture
+def stub_servers():
+    servers = []
+    for name in ("a", "b"):
+        server = ThreadingHTTPServer(("127.0.0.1", 0), StubOllamaHandler)
+        server.name = name
+        server.calls = []
+        threading.Thread(target=server.serve_forever, daemon=True).start()
+        servers.append(server)
+    yield servers
+    for server in servers:
+        server.shutdown()
+        server.server_close()
+
+def host_of(server) -> str:
+    return f"http://127.0.0.1:{server.server_address[1]}"
+
+@pytest.mark.asyncio
+async def test_gateway_user_affinity(stub_servers):
+    """Тест закрепления пользователя за одним сервером"""
+    gateway = LLMGateway([host_of(s) for s in stub_servers])
+    messages = [{"role": "user", "content": "Привет"}]
+
+    answers = {
+        (await gateway.chat(user_id=42, model="m", messages=messages))["message"]["content"]
+        for _ in range(5)
+    }
+    assert len(answers) == 1
+    await gateway.close()
+
+@pytest.mark.asyncio
+async def test_gateway_retries_raw_connect_error(stub_servers):
+    """Тест повтора на другом сервере, если клиент отдал httpx.ConnectError как есть"""
+    gateway = LLMGateway([host_of(s) for s in stub_servers])
+    first = gateway.pick(user_id=42)
+
+    async def refuse(**kwargs):
+        raise httpx.ConnectError("connection refused")
+
+    first.client.chat = refuse
+    response = await gateway.chat(user_id=42, model="m", messages=[{"role": "user", "content": "Привет"}])
+
+    assert response["message"]["content"] in {"a", "b"}
+    assert first.failures == 1
+    await gateway.close()
+
+@pytest.mark.asyncio
+async def test_gateway_least_loaded():
+    """Тест выбора наименее загруженного сервера"""
+    gateway = LLMGateway(["http://127.0.0.1:1", "http://127.0.0.1:2"], affinity_slack=0)
+    busy, idle = gateway.endpoints
+    busy.in_flight = 3
+
+    assert gateway.pick() is idle
+    for user_id in range(20):
+        assert gateway.pick(user_id) is idle
+    await gateway.close()
+
+@pytest.mark.asyncio
+async def test_gateway_ejects_and_readmits(stub_servers):
+    """Тест исключения недоступного сервера и возврата после проверки здоровья"""
+    dead_server = stub_servers[1]
+    dead_host = host_of(dead_server)
+    dead_server.shutdown()
+    dead_server.server_close()
+
+    gateway = LLMGateway([host_of(stub_servers[0]), dead_host], failure_threshold=1)
+    dead = gateway.endpoints[1]
+    messages = [{"role": "user", "content": "Привет"}]
+
+    for user_id in range(10):
+        response = await gateway.chat(user_id=user_id, model="m", messages=messages)
+        assert response["message"]["content"] == "a"
+    assert not dead.healthy
+
+    revived = ThreadingHTTPServer(("127.0.0.1", dead_server.server_address[1]), StubOllamaHandler)
+    revived.name = "b"
+    revived.calls = []
+    threading.Thread(target=revived.serve_forever, daemon=True).start()
+    try:
+        await gateway.check_health()
+        assert dead.healthy
+    finally:
+        revived.shutdown()
+        revived.server_close()
+        await gateway.close()
+
+def test_router_classification():
+    """Тест выбора быстрой и сильной модели"""
+    router = ModelRouter("small", "large", max_fast_chars=50, max_fast_history=4)
+    system = {"role": "system", "content": "prompt"}
+
+    assert router.classify([system, {"role": "user", "content": "Спасибо!"}]).model == "small"
+    assert router.classify([system, {"role": "user", "content": "Объясни, как работает DNS"}]).model == "large"
+    assert router.classify([system, {"role": "user", "content": "а" * 51}]).model == "large"
+    long_dialog = [system] + [{"role": "user", "content": "ок"}] * 5
+    assert router.classify(long_dialog).model == "small"
+    assert router.classify(long_dialog + [{"role": "user", "content": "а" * 30}]).model == "large"
+
+def test_router_short_reply_in_compacted_window():
+    """Тест: короткая реплика посреди диалога идёт в быструю модель"""
+    router = ModelRouter("small", "large")
+    rows = [
+        {"id": i, "role": "user" if i % 2 else "assistant", "content": f"Сообщение {i} " * 10}
+        for i in range(1, 20)
+    ] + [{"id": 20, "role": "user", "content": "спасибо"}]
+    history, _ = select_history_window(
+        rows, None, max_messages=HISTORY_WINDOW_MAX,
+        max_chars=MAX_HISTORY_CHARS, keep_messages=HISTORY_MESSAGES_LIMIT,
+    )
+    assert len(history) == HISTORY_MESSAGES_LIMIT
+    assert router.classify(build_messages("prompt", history)).model == "small"
+
+    grown = history + [{"role": "assistant", "content": "ок"}] * 6 + [{"role": "user", "content": "спасибо"}]
+    assert router.classify(build_messages("prompt", grown)).model == "small"
+
+class FakeGateway:
+    def __init__(self, answers):
+        self.answers = answers
+        self.models = []
+
+    async def chat(self, user_id=None, model=None, messages=None, options=None, keep_alive=None):
+        self.models.append(model)
+        return {"model": model, "message": {"role": "assistant", "content": self.answers[model]}}
+
+@pytest.mark.asyncio
+async def test_router_falls_back_on_empty_answer():
+    """Тест перехода на сильную модель при пустом ответе быстрой"""
+    gateway = FakeGateway({"small": "  ", "large": "Ответ"})
+    client = LLMClient(gateway, model="large", router=ModelRouter("small", "large"))
+
+    response = await client.chat([{"role": "user", "content": "Привет"}], user_id=1)
+
+    assert gateway.models == ["small", "large"]
+    assert response["model"] == "large"
+    assert response["message"]["content"] == "Ответ"
+
+@pytest.mark.asyncio
+async def test_warm_up_preloads_all_endpoints(stub_servers):
+    """Тест предзагрузки модели с keep_alive и опциями на всех серверах"""
+    gateway = LLMGateway([host_of(s) for s in stub_servers])
+    client = LLMClient(gateway, model="m", options={"num_ctx": 4096}, keep_alive=-1)
+
+    await client.warm_up()
+    await client.chat([{"role": "user", "content": "Привет"}], user_id=1)
+
+    for server in stub_servers:
+        path, body = server.calls[0]
+        assert path == "/api/generate"
+        assert body["keep_alive"] == -1
+        assert body["options"] == {"num_ctx": 4096}
+    chat_calls = [body for s in stub_servers for path, body in s.calls if path == "/api/chat"]
+    assert chat_calls[0]["keep_alive"] == -1
+    await gateway.close()
+
+def make_rows(count: int, start_id: int = 1) -> list:
+    return [
+        {"id": i, "role": "user" if i % 2 else "assistant", "content": f"сообщение {i}"}
+        for i in range(start_id, start_id + count)
+    ]
+
+def test_history_window_is_append_only():
+    """Тест: начало окна истории не сдвигается, пока окно не переполнено"""
+    history, anchor = select_history_window(make_rows(3), None, max_messages=6, max_chars=1000, keep_messages=4)
+    assert anchor == 1 and len(history) == 3
+
+    previous = history
+    for count in range(4, 7):
+        history, anchor = select_history_window(make_rows(count), anchor, 6, 1000, 4)
+        assert anchor == 1
+        assert history[:len(previous)] == previous
+        previous = history
+
+def test_history_window_compacts_on_overflow():
+    """Тест сжатия окна при переполнении по числу сообщений и символам"""
+    history, anchor = select_history_window(make_rows(7), 1, max_messages=6, max_chars=1000, keep_messages=4)
+    assert anchor == 4
+    assert [m["content"] for m in history] == [f"сообщение {i}" for i in range(4, 8)]
+
+    rows = [{"id": 1, "role": "user", "content": "а" * 500}, {"id": 2, "role": "assistant", "content": "б" * 500}]
+    history, anchor = select_history_window(rows, 1, max_messages=6, max_chars=800, keep_messages=4)
+    assert anchor == 2 and len(history) == 1
@@ -0,0 +1,59 @@
+import json
+import logging
+import random
+from src.utils.logger import SamplingFilter, parse_sample_rates, setup_logging, stop_logging
+
+def make_record(level=logging.INFO, name="src.bot", stage=None):
+    record = logging.LogRecord(name, level, __file__, 1, "msg", None, None)
+    if stage is not None:
+        record.stage = stage
+    return record
+
+def test_parse_sample_rates():
+    """Тест разбора строки с долями логирования"""
+    assert parse_sample_rates("voice_received=0.1, llm_cache_hit = 0.01") == {
+        "voice_received": 0.1,
+        "llm_cache_hit": 0.01,
+    }
+    assert parse_sample_rates("") == {}
+    assert parse_sample_rates("broken,stt=1") == {"stt": 1.0}
+
+def test_sampling_filter_by_stage(monkeypatch):
+    """Тест: доля применяется по stage, WARNING и выше проходят всегда"""
+    sampler = SamplingFilter({"voice_received": 0.1, "src.llm": 0.0})
+    monkeypatch.setattr(random, "random", lambda: 0.5)
+
+    assert not sampler.filter(make_record(stage="voice_received"))
+    assert sampler.filter(make_record(stage="stt"))
+    assert sampler.filter(make_record(level=logging.WARNING, stage="voice_received"))
+    assert not sampler.filter(make_record(name="src.llm"))
+    assert sampler.filter(make_record(level=logging.ERROR, name="src.llm"))
+
+    monkeypatch.setattr(random, "random", lambda: 0.05)
+    assert sampler.filter(make_record(stage="voice_received"))
+
+def test_json_logging_through_queue(tmp_path):
+    """Тест: структурные поля и traceback доходят до файла через очередь"""
+    log_file = tmp_path / "bot.log"
+    setup_logging(log_file=str(log_file), json_format=True, sample_rates={"noisy": 0.0})
+    try:
+        logger = logging.getLogger("src.test")
+        logger.info("Ответ за %d мс", 42, extra={"user_id": 7, "stage": "llm", "latency_ms": 42})
+        logger.info("не попадёт в лог", extra={"stage": "noisy"})
+        try:
+            raise ValueError("boom")
+        except ValueError:
+            logger.exception("Ошибка обработки")
+    finally:
+        stop_logging()
+
+    records = [json.loads(line) for line in log_file.read_text(encoding="utf-8").splitlines()]
+    records = [r for r in records if r["logger"] == "src.test"]
+    assert len(records) == 2
+
+    answer, error = records
+    assert answer["message"] == "Ответ за 42 мс"
+    assert (answer["user_id"], answer["stage"], answer["latency_ms"]) == (7, "llm", 42)
+    assert error["message"] == "Ошибка обработки"
+    assert error["level"] == "ERROR"
+    assert "ValueError: boom" in error["exc_info"]
@@ -1,9 +1,17 @@
 import pytest
 import asyncio
+import json
+import os
+from types import SimpleNamespace
 from pathlib import Path
 import tempfile
+import edge_tts
 from src.voice.tts_manager import EdgeTTSManager
+from src.voice.voice_catalog import VoiceCatalog
 from src.voice.audio_utils import safe_unlink
+from src.voice import stt_processor
+from src.voice.stt_tuner import candidate_configs, load_profile, select_best, word_error_rate
+from src.utils.helpers import split_text
 
 @pytest.fixture
 def tts_manager():
@@ -49,4 +57,220 @@ async def test_get_available_voices(tts_manager):
         voice = voices[0]
         assert "ShortName" in voice
         assert "Gender" in voice
-        assert "Locale" in voice
\ No newline at end of file
+        assert "Locale" in voice
+
+FAKE_VOICES = [
+    {"ShortName": "ru-RU-SvetlanaNeural", "Gender": "Female", "Locale": "ru-RU"},
+    {"ShortName": "ru-RU-DmitryNeural", "Gender": "Male", "Locale": "ru-RU"},
+    {"ShortName": "en-US-AriaNeural", "Gender": "Female", "Locale": "en-US"},
+]
+
+@pytest.mark.asyncio
+async def test_voice_catalog_single_flight(tmp_path, monkeypatch):
+    """Тест объединения параллельных обновлений каталога в один запрос"""
+    calls = 0
+
+    async def fake_list_voices():
+        nonlocal calls
+        calls += 1
+        await asyncio.sleep(0.01)
+        return FAKE_VOICES
+
+    monkeypatch.setattr(edge_tts, "list_voices", fake_list_voices)
+    catalog = VoiceCatalog(tmp_path / "voices.json")
+
+    results = await asyncio.gather(*(catalog.get_voices("ru-RU") for _ in range(5)))
+
+    assert calls == 1
+    assert all(len(r) == 2 for r in results)
+    assert [v["ShortName"] for v in await catalog.get_voices("en")] == ["en-US-AriaNeural"]
+    assert calls == 1
+
+@pytest.mark.asyncio
+async def test_voice_catalog_snapshot(tmp_path, monkeypatch):
+    """Тест загрузки снимка каталога без обращения к сети"""
+    async def fake_list_voices():
+        return FAKE_VOICES
+
+    monkeypatch.setattr(edge_tts, "list_voices", fake_list_voices)
+    snapshot = tmp_path / "voices.json"
+    await VoiceCatalog(snapshot).refresh()
+    assert snapshot.exists()
+
+    async def failing_list_voices():
+        raise RuntimeError("offline")
+
+    monkeypatch.setattr(edge_tts, "list_voices", failing_list_voices)
+    manager = EdgeTTSManager(temp_dir=tmp_path, catalog=VoiceCatalog(snapshot))
+
+    voices = await manager.get_available_voices()
+    assert len(voices) == 2
+    assert "en-US-AriaNeural" in manager.available_voices
+
+@pytest.mark.asyncio
+async def test_hedged_synthesis_fallback(tmp_path, monkeypatch):
+    """Тест запуска запасного голоса, если основной завис"""
+    manager = EdgeTTSManager(temp_dir=tmp_path, hedge_delay=0.05, attempt_timeout=1.0)
+    started = []
+
+    async def fake_synthesize(chunks, voice, path):
+        started.append(voice)
+        if voice == "ru-RU-SvetlanaNeural":
+            await asyncio.sleep(10)
+        path.write_bytes(b"\0" * 2000)
+        return path
+
+    monkeypatch.setattr(manager, "_synthesize", fake_synthesize)
+    audio_path = await manager.text_to_speech("Привет", 1)
+
+    assert audio_path is not None and audio_path.exists()
+    assert started == ["ru-RU-SvetlanaNeural", "ru-RU-DmitryNeural"]
+    assert not list(tmp_path.glob("tts_1_*_*.mp3"))
+    safe_unlink(audio_path)
+
+@pytest.mark.asyncio
+async def test_failing_voice_is_skipped(tmp_path, monkeypatch):
+    """Тест исключения голоса после повторных сбоев"""
+    manager = EdgeTTSManager(temp_dir=tmp_path, hedge_delay=1.0)
+    started = []
+
+    async def fake_synthesize(chunks, voice, path):
+        started.append(voice)
+        if voice == "ru-RU-SvetlanaNeural":
+            raise RuntimeError("boom")
+        path.write_bytes(b"\0" * 2000)
+        return path
+
+    monkeypatch.setattr(manager, "_synthesize", fake_synthesize)
+    for i in range(3):
+        safe_unlink(await manager.text_to_speech(f"Привет {i}", 100 + i))
+
+    assert not manager.health.is_healthy("ru-RU-SvetlanaNeural")
+    assert started[-1] == "ru-RU-DmitryNeural"
+    assert started.count("ru-RU-SvetlanaNeural") == 2
+
+@pytest.mark.asyncio
+async def test_hung_voice_does_not_block_fallback(tmp_path, monkeypatch):
+    """Тест: зависший голос не держит слоты запасного и не считается сбойным из-за очереди"""
+    manager = EdgeTTSManager(temp_dir=tmp_path, hedge_delay=0.05, attempt_timeout=1.0, chunk_concurrency=1)
+    started = []
+
+    async def fake_fetch_chunk(text, voice, path):
+        started.append(voice)
+        if voice == "ru-RU-SvetlanaNeural":
+            await asyncio.sleep(10)
+        path.write_bytes(b"\0" * 2000)
+
+    monkeypatch.setattr(manager, "_fetch_chunk", fake_fetch_chunk)
+    loop = asyncio.get_running_loop()
+    began = loop.time()
+    audio_path = await manager.text_to_speech("Привет. " * 100, 1)
+
+    assert audio_path is not None
+    assert loop.time() - began < 0.5
+    assert set(started) == {"ru-RU-SvetlanaNeural", "ru-RU-DmitryNeural"}
+    assert manager.health.is_healthy("ru-RU-SvetlanaNeural")
+    safe_unlink(audio_path)
+
+@pytest.mark.asyncio
+async def test_long_answer_does_not_hedge_healthy_voice(tmp_path, monkeypatch):
+    """Тест: задержка подстраховки растёт с числом волн кусков"""
+    manager = EdgeTTSManager(temp_dir=tmp_path, hedge_delay=0.05, chunk_chars=40, chunk_concurrency=2)
+    fetched = []
+
+    async def fake_fetch_chunk(text, voice, path):
+        fetched.append(voice)
+        await asyncio.sleep(0.03)
+        path.write_bytes(b"\0" * 2000)
+
+    monkeypatch.setattr(manager, "_fetch_chunk", fake_fetch_chunk)
+    text = "Короткое предложение номер раз. " * 8
+    assert len(split_text(text, 40)) == 8
+    audio_path = await manager.text_to_speech(text, 1)
+
+    assert audio_path is not None
+    assert fetched == ["ru-RU-SvetlanaNeural"] * 8
+    safe_unlink(audio_path)
+
+def test_split_text_boundaries():
+    """Тест разбиения длинного текста по предложениям без потерь"""
+    text = "Первое предложение. Второе предложение!\n\nНовый абзац? " + "слово " * 100
+    chunks = split_text(text, max_chars=60)
+
+    assert all(len(c) <= 60 for c in chunks)
+    assert chunks[0] == "Первое предложение. Второе предложение! Новый абзац?"
+    assert " ".join(chunks).split() == text.split()
+    assert split_text("Коротко.", max_chars=60) == ["Коротко."]
+
+@pytest.mark.asyncio
+async def test_chunked_synthesis_keeps_order(tmp_path, monkeypatch):
+    """Тест параллельного синтеза кусков и склейки по порядку"""
+    manager = EdgeTTSManager(temp_dir=tmp_path, chunk_chars=40, chunk_cache_dir=tmp_path / "cache")
+    calls = []
+
+    async def fake_synthesize_chunk(text, voice, path, semaphore):
+        calls.append(text)
+        await asyncio.sleep(0.01 * (5 - len(calls)))
+        path.write_bytes(text.encode() * 100)
+
+    monkeypatch.setattr(manager, "_synthesize_chunk", fake_synthesize_chunk)
+    text = "Раз два три четыре. Пять шесть семь восемь. Девять десять одиннадцать."
+    audio_path = await manager.text_to_speech(text, 1)
+
+    chunks = split_text(text, 40)
+    assert len(chunks) > 1
+    assert audio_path.read_bytes() == b"".join(c.encode() * 100 for c in chunks)
+    assert not list(tmp_path.glob("*_part*.mp3"))
+    safe_unlink(audio_path)
+
+def test_word_error_rate():
+    """Тест WER: регистр и пунктуация не считаются ошибками"""
+    assert word_error_rate("Привет, как дела?", "привет как дела") == 0
+    assert word_error_rate("раз два три четыре", "раз три четыре пять") == 0.5
+
+def test_whisper_candidates_do_not_oversubscribe():
+    """Тест сетки параметров Whisper"""
+    candidates = candidate_configs(cpu_count=4, compute_types=["int8"])
+    assert all(c["cpu_threads"] * c["num_workers"] <= 4 for c in candidates)
+    assert {c["beam_size"] for c in candidates} == {1, 5}
+    assert candidate_configs(cpu_count=1, compute_types=["int8"])[0]["cpu_threads"] == 1
+
+def test_select_best_respects_tolerance():
+    """Тест: самый быстрый вариант среди достаточно точных"""
+    results = [
+        {"beam_size": 5, "seconds_per_clip": 2.0, "wer": 0.02},
+        {"beam_size": 1, "seconds_per_clip": 1.0, "wer": 0.05},
+        {"beam_size": 1, "seconds_per_clip": 0.5, "wer": 0.30},
+    ]
+    assert select_best(results, tolerance=0.05)["seconds_per_clip"] == 1.0
+    assert select_best(results, tolerance=0.0)["seconds_per_clip"] == 2.0
+
+def test_whisper_profile_ignored_on_other_machine(tmp_path):
+    """Тест: профиль с другой машины не применяется"""
+    path = tmp_path / "profile.json"
+    profile = {"model": "base", "device": "cpu", "cpu_count": os.cpu_count(),
+               "compute_type": "int8", "cpu_threads": 2, "num_workers": 1, "beam_size": 1}
+    path.write_text(json.dumps(profile))
+    assert load_profile(path, "base") == {"compute_type": "int8", "cpu_threads": 2, "num_workers": 1, "beam_size": 1}
+    assert load_profile(path, "small") is None
+
+    path.write_text(json.dumps({**profile, "cpu_count": os.cpu_count() + 1}))
+    assert load_profile(path, "base") is None
+
+class FakeWhisperModel:
+    def __init__(self, size, **kwargs):
+        self.size = size
+
+    def transcribe(self, path, language=None, beam_size=None):
+        return [SimpleNamespace(text=self.size)], None
+
+def test_degraded_whisper_loads_in_background(monkeypatch):
+    """Тест: меньшая модель грузится заранее, до загрузки используется основная"""
+    monkeypatch.setattr(stt_processor, "WhisperModel", FakeWhisperModel)
+    stt = stt_processor.STTProcessor("base", degraded_model_size="tiny")
+
+    assert stt.transcribe(Path("voice.wav"), degraded=True) == "base"
+
+    stt.load_degraded_in_background().join(timeout=5)
+    assert stt.transcribe(Path("voice.wav"), degraded=True) == "tiny"
+    assert stt.transcribe(Path("voice.wav")) == "base"